@@ -31,6 +31,9 @@ import EmailForm from "../components/EmailForm";
 import ClearChatButton from "../components/ClearChatButton";
 import { MdOutlineMarkEmailRead, MdAttachFile } from "react-icons/md";
 
+// Recent messages sent along with a chat request (the server keeps the full history)
+const CHAT_HISTORY_WINDOW = 20;
+
 function Chat() {
   const { agentId } = useParams();
   const toast = useToast();
@@ -174,13 +177,13 @@ function Chat() {
         body: JSON.stringify({
           agent_id: agentId,
           message: input,
-          chat_history: messages,
+          chat_history: messages.slice(-CHAT_HISTORY_WINDOW),
         }),
       });
 
       if (res.ok) {
         const data = await res.json();
-        setMessages(data.chat_history || []);
+        setMessages([...messages, ...(data.messages || [])]);
       } else {
         throw new Error("Failed to chat");
       }
@@ -4,3 +4,4 @@ from . import tools
 from . import users
 from . import letters
 from . import email
+from . import jobs
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from typing import List
-import json, uuid, sqlite3, os, shutil
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
+from typing import List, Optional
+import json, uuid, os, shutil, base64
+from app.core.config import EMBEDDING_BACKEND, VECTOR_INDEX_TYPE
+from app.core.database import db
 from app.services.pdf_processor import PDFProcessor
 from app.services.prompt_generator import SystemPromptGenerator
 from app.services.agent_runner import ReActAgent
-from app.models.chat import AgentUpdateRequest
+from app.services.vector_index import delete_agent_index, INDEX_TYPES
+from app.services.rag_engine import invalidate_agent
+from app.services.agent_versions import bump_agent_version
+from app.services.assignment_cache import assignment_cache
+from app.services.upload_storage import spool_uploads, remove_uploads
+from app.services.ingestion_jobs import aenqueue_job, insert_agent
+from app.services.embedding_backends import EMBEDDING_BACKENDS
+from app.models.chat import AgentUpdateRequest, AgentReindexRequest
 from app.dependencies.auth_dependencies import AuthDependencies
 
 router = APIRouter()
@@ -13,77 +22,111 @@ pdf_processor = PDFProcessor()
 prompt_generator = SystemPromptGenerator()
 auth_dependencies = AuthDependencies()
 
+AGENT_LIST_COLUMNS = {
+    "name": "a.name",
+    "description": "a.description",
+    "tools": "a.tools",
+    "created_at": "a.created_at",
+    "embedding_backend": "a.embedding_backend",
+    "index_type": "a.index_type",
+    "assigned_users": '''(
+        SELECT json_group_array(json_object('id', u.id, 'name', u.username, 'role', u.role))
+        FROM agent_assignments aa
+        JOIN users u ON aa.user_id = u.id
+        WHERE aa.agent_id = a.id
+    )''',
+}
+
+def _encode_cursor(created_at, agent_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, agent_id]).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, agent_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, agent_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/")
-async def get_agents(user=Depends(auth_dependencies.get_current_user)):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    
-    if user["role"] == "admin":
-        cursor.execute('SELECT id, name, description, tools, created_at FROM agents')
-        agents = cursor.fetchall()
+async def get_agents(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(auth_dependencies.get_current_user)
+):
+    # Requested fields (id is always returned and is needed for the cursor)
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip() and f.strip() != "id"]
+        unknown = [f for f in selected if f not in AGENT_LIST_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
     else:
-        assigned_ids = ReActAgent.get_assigned_agents(user["sub"])
-        if not assigned_ids:
-            conn.close()
-            return {"agents": []}
-        placeholders = ','.join('?' for _ in assigned_ids)
-        query = f'SELECT id, name, description, tools, created_at FROM agents WHERE id IN ({placeholders})'
-        cursor.execute(query, assigned_ids)
-        agents = cursor.fetchall()
-    
+        selected = list(AGENT_LIST_COLUMNS)
+
+    columns = ["a.id", "a.created_at AS _cursor_created_at"]
+    columns += [f"{AGENT_LIST_COLUMNS[f]} AS {f}" for f in selected]
+
+    # One query for the page: assignments are aggregated per agent and
+    # non-admins are filtered with EXISTS instead of a separate lookup.
+    where = []
+    params = []
+    if user["role"] != "admin":
+        where.append("EXISTS (SELECT 1 FROM agent_assignments x WHERE x.agent_id = a.id AND x.user_id = ?)")
+        params.append(user["sub"])
+    if cursor:
+        created_at, agent_id = _decode_cursor(cursor)
+        where.append("(a.created_at, a.id) > (?, ?)")
+        params.extend([created_at, agent_id])
+
+    query = f"SELECT {', '.join(columns)} FROM agents a"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY a.created_at, a.id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = await db.afetchall(query, params)
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["_cursor_created_at"], rows[-1]["id"])
+
     result = []
-    for agent in agents:
-        agent_id = agent[0]
-        # Fetch assigned users for this agent
-        cursor.execute('''
-            SELECT users.id, users.username, users.role
-            FROM agent_assignments
-            JOIN users ON agent_assignments.user_id = users.id
-            WHERE agent_assignments.agent_id = ?
-        ''', (agent_id,))
-        assigned_users_raw = cursor.fetchall()
-        assigned_users = [
-            {"id": u[0], "name": u[1], "role": u[2]} for u in assigned_users_raw
-        ]
-        
-        result.append({
-            "id": agent_id,
-            "name": agent[1],
-            "description": agent[2],
-            "tools": json.loads(agent[3]),
-            "created_at": agent[4],
-            "assigned_users": assigned_users,
-        })
+    for row in rows:
+        agent = {"id": row["id"]}
+        for field in selected:
+            value = row[field]
+            if field == "tools":
+                value = json.loads(value)
+            elif field == "assigned_users":
+                value = json.loads(value) if value else []
+            agent[field] = value
+        result.append(agent)
     
-    conn.close()
-    return {"agents": result}
+    return {"agents": result, "next_cursor": next_cursor}
 
 @router.get("/{agent_id}")
 async def get_agent(agent_id: str):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT id, name, description, tools, created_at FROM agents WHERE id = ?', (agent_id,))
-    agent = cursor.fetchone()
+    agent = await db.afetchone('SELECT id, name, description, tools, created_at, embedding_backend, index_type FROM agents WHERE id = ?', (agent_id,))
     
     if not agent:
-        conn.close()
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    cursor.execute('''
+    assigned_rows = await db.afetchall('''
         SELECT user_id FROM agent_assignments WHERE agent_id = ?
     ''', (agent_id,))
-    assigned_rows = cursor.fetchall()
     assigned_user_ids = [str(user_id) for (user_id,) in assigned_rows]
 
-    conn.close()
-
     return {
         "id": agent[0],
         "name": agent[1],
         "description": agent[2],
         "tools": json.loads(agent[3]),
         "created_at": agent[4],
+        "embedding_backend": agent[5],
+        "index_type": agent[6],
         "assigned_user_ids": assigned_user_ids  # 👈 Add this line
     }
 
@@ -93,54 +136,50 @@ async def create_agent(
     description: str = Form(...),
     tools: str = Form(...),
     assigned_user_ids: str = Form(...),  # ← New field
+    embedding_backend: Optional[str] = Form(None),
+    index_type: Optional[str] = Form(None),
     files: List[UploadFile] = File(default=[]),
     user=Depends(auth_dependencies.require_role("admin"))
 ):
+    embedding_backend = embedding_backend or EMBEDDING_BACKEND
+    if embedding_backend not in EMBEDDING_BACKENDS:
+        raise HTTPException(status_code=400, detail=f"embedding_backend must be one of: {', '.join(EMBEDDING_BACKENDS)}")
+    index_type = index_type or VECTOR_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"index_type must be one of: {', '.join(INDEX_TYPES)}")
+
     try:
         agent_id = str(uuid.uuid4())
         tool_list = json.loads(tools)
         user_ids = json.loads(assigned_user_ids)  # ← Parse input
 
-        vector_index_path = None
-        knowledge_summary = ""
+        payload = {
+            "name": name,
+            "description": description,
+            "tools": tool_list,
+            "assigned_user_ids": user_ids,
+            "embedding_backend": embedding_backend,
+            "index_type": index_type,
+        }
 
         if files and files[0].filename:
-            pdf_contents = []
-            for file in files:
-                content = await file.read()
-                pdf_contents.append(content)
-
-            vector_index_path = pdf_processor.process_and_store_pdfs(pdf_contents, agent_id)
-            for content in pdf_contents:
-                text = pdf_processor.extract_text_from_pdf(content)
-                knowledge_summary += text[:1000] + "..."
-
-        system_prompt = prompt_generator.generate_system_prompt(name, description, knowledge_summary)
-
-        conn = sqlite3.connect('agents.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO agents (id, name, description, tools, system_prompt, vector_index_path)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (agent_id, name, description, json.dumps(tool_list), system_prompt, vector_index_path))
-
-        # Add agent assignments
-        for user_id in user_ids:
-            assignment_id = str(uuid.uuid4())
-            cursor.execute(
-                '''
-                INSERT INTO agent_assignments (id, agent_id, user_id)
-                VALUES (?, ?, ?)
-                ''',
-                (assignment_id, agent_id, user_id)
-            )
+            # Spool to disk and hand extraction, OCR and embedding to a background job
+            uploads = await spool_uploads(files)
+            try:
+                job_id = await aenqueue_job("create_agent", agent_id, user["sub"], uploads, payload)
+            except Exception:
+                remove_uploads(uploads)
+                raise
+            return {"message": "Agent creation queued", "agent_id": agent_id, "job_id": job_id}
 
-        conn.commit()
-        conn.close()
+        system_prompt = prompt_generator.generate_system_prompt(name, description, "")
+        await db.atransaction(insert_agent, agent_id, payload, system_prompt, None)
+        assignment_cache.invalidate(agent_id, payload["assigned_user_ids"])
 
         return {"message": "Agent created and assigned successfully", "agent_id": agent_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -150,15 +189,10 @@ async def create_agent(
 
 @router.put("/{agent_id}")
 async def update_agent(agent_id: str, update: AgentUpdateRequest):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-
     # Fetch existing agent to verify it exists
-    cursor.execute('SELECT id, name, description, tools, system_prompt FROM agents WHERE id = ?', (agent_id,))
-    existing = cursor.fetchone()
+    existing = await db.afetchone('SELECT id, name, description, tools, system_prompt FROM agents WHERE id = ?', (agent_id,))
 
     if not existing:
-        conn.close()
         raise HTTPException(status_code=404, detail="Agent not found")
 
     current_name, current_description, current_tools_json, current_prompt = existing[1], existing[2], existing[3], existing[4]
@@ -177,60 +211,78 @@ async def update_agent(agent_id: str, update: AgentUpdateRequest):
         if regenerate_prompt else current_prompt
     )
 
-    cursor.execute('''
-        UPDATE agents
-        SET name = ?, description = ?, tools = ?, system_prompt = ?
-        WHERE id = ?
-    ''', (new_name, new_description, new_tools_json, new_prompt, agent_id))
+    def write_update(conn):
+        conn.execute('''
+            UPDATE agents
+            SET name = ?, description = ?, tools = ?, system_prompt = ?
+            WHERE id = ?
+        ''', (new_name, new_description, new_tools_json, new_prompt, agent_id))
+        bump_agent_version(conn, agent_id)
 
-    if update.assigned_user_ids is not None:
-        cursor.execute('DELETE FROM agent_assignments WHERE agent_id = ?', (agent_id,))
-        for user_id in update.assigned_user_ids:
-            assignment_id = str(uuid.uuid4())
-            cursor.execute(
+        if update.assigned_user_ids is not None:
+            conn.execute('DELETE FROM agent_assignments WHERE agent_id = ?', (agent_id,))
+            conn.executemany(
                 'INSERT INTO agent_assignments (id, agent_id, user_id) VALUES (?, ?, ?)',
-                (assignment_id, agent_id, user_id)
+                [(str(uuid.uuid4()), agent_id, user_id) for user_id in update.assigned_user_ids]
             )
 
-    conn.commit()
-    conn.close()
+    await db.atransaction(write_update)
+    # Sessions and cached answers were built from the old configuration
+    invalidate_agent(agent_id)
+    if update.assigned_user_ids is not None:
+        assignment_cache.invalidate(agent_id, update.assigned_user_ids)
 
     return {"message": "Agent updated successfully", "agent_id": agent_id}
 
 
+@router.post("/{agent_id}/reindex")
+async def reindex_agent(
+    agent_id: str,
+    request: AgentReindexRequest,
+    user=Depends(auth_dependencies.require_role("admin"))
+):
+    if request.index_type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"index_type must be one of: {', '.join(INDEX_TYPES)}")
+    if not await db.afetchone("SELECT id FROM agents WHERE id = ?", (agent_id,)):
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    await db.aexecute("UPDATE agents SET index_type = ?, version = version + 1 WHERE id = ?", (request.index_type, agent_id))
+
+    # Rebuilding re-reads every segment, so it runs as a background job like uploads
+    job_id = await aenqueue_job("reindex", agent_id, user["sub"], [])
+    return {
+        "message": "Agent reindex queued",
+        "agent_id": agent_id,
+        "index_type": request.index_type,
+        "job_id": job_id,
+    }
+
 @router.delete("/{agent_id}")
 async def delete_agent(agent_id: str):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM agents WHERE id = ?', (agent_id,))
-    cursor.execute('DELETE FROM chat_history WHERE agent_id = ?', (agent_id,))
-    
-    conn.commit()
-    conn.close()
-    
-    # Clean up vector index files
-    vector_path = f"data/vectors/{agent_id}"
-    if os.path.exists(vector_path):
-        import shutil
-        shutil.rmtree(vector_path)
-    
+    def delete_rows(conn):
+        conn.execute('DELETE FROM agents WHERE id = ?', (agent_id,))
+        conn.execute('DELETE FROM chat_history WHERE agent_id = ?', (agent_id,))
+        conn.execute('DELETE FROM chat_messages WHERE agent_id = ?', (agent_id,))
+        delete_agent_index(conn, agent_id)
+
+    await db.atransaction(delete_rows)
+    invalidate_agent(agent_id)
+    assignment_cache.invalidate(agent_id)
+    # Index files are removed by the compactor once no worker can still be reading them
+
     return {"message": "Agent deleted successfully"}
 
 @router.delete("/{agent_id}/clear-chat")
 async def clear_chat(agent_id: str):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    
     # Check if agent exists (optional, but good practice)
-    cursor.execute("SELECT id FROM agents WHERE id = ?", (agent_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not await db.afetchone("SELECT id FROM agents WHERE id = ?", (agent_id,)):
         raise HTTPException(status_code=404, detail="Agent not found")
     
     # Delete chat history for this agent
-    cursor.execute("DELETE FROM chat_history WHERE agent_id = ?", (agent_id,))
-    conn.commit()
-    conn.close()
+    def delete_history(conn):
+        conn.execute("DELETE FROM chat_history WHERE agent_id = ?", (agent_id,))
+        conn.execute("DELETE FROM chat_messages WHERE agent_id = ?", (agent_id,))
+
+    await db.atransaction(delete_history)
     
     return {"message": "Chat history cleared successfully"}
\ No newline at end of file
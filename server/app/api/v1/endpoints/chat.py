@@ -1,20 +1,37 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
-from app.services.rag_engine import get_or_create_agent, agent_pool
-from app.services.agent_runner import ReActAgent
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Query
+from fastapi.responses import StreamingResponse
+from app.services.rag_engine import get_or_create_agent, get_pool_stats
 from app.services.pdf_processor import PDFProcessor
 from app.dependencies.auth_dependencies import AuthDependencies
 from app.models.chat import ChatRequest
 from app.models.chat import ChatMessage
+from app.core.database import db
+from app.services.bounded_executor import inference_executor
+from app.services.embedding_cache import get_embedding_cache_stats
+from app.services.extraction_cache import extraction_cache
+from app.services.answer_cache import answer_cache
+from app.services.assignment_cache import assignment_cache
+from app.services.context_packer import get_packing_stats
+from app.services.agent_versions import get_agent_version
+from app.services.upload_storage import spool_uploads, remove_uploads
+from app.services.ingestion_jobs import aenqueue_job
+from app.services.chat_store import aappend_messages, aget_messages, DEFAULT_HISTORY_LIMIT
+from app.core.config import CHAT_HISTORY_MAX_MESSAGES
 from langchain_community.vectorstores import FAISS
-from typing import List
-from datetime import datetime
-import sqlite3, json, os
+from typing import List, Optional
+import json, os
 
 router = APIRouter()
 
 auth_dependencies = AuthDependencies()
 pdf_processor = PDFProcessor()
 
+def _recent_history(chat_request: ChatRequest) -> List[ChatMessage]:
+    # However long the client's transcript grows, only a fixed window is used
+    if CHAT_HISTORY_MAX_MESSAGES <= 0:
+        return []
+    return chat_request.chat_history[-CHAT_HISTORY_MAX_MESSAGES:]
+
 @router.post("/")
 async def chat_with_agent(
     chat_request: ChatRequest, 
@@ -31,59 +48,139 @@ async def chat_with_agent(
 
         # Only admins or assigned users can chat with this agent
         if user_role != "admin":
-            assigned_agents = ReActAgent.get_assigned_agents(user_id)
-            if chat_request.agent_id not in assigned_agents:
+            if not await assignment_cache.is_assigned(user_id, chat_request.agent_id):
                 raise HTTPException(status_code=403, detail="You are not authorized to chat with this agent.")
         
-        agent = get_or_create_agent(chat_request.agent_id, user_id)
-        response = agent.chat(chat_request.message, chat_request.chat_history)
+        version = await db.run(get_agent_version, chat_request.agent_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Agent not found")
+
+        agent = get_or_create_agent(chat_request.agent_id, user_id, version)
+        response = await inference_executor.run(agent.chat, chat_request.message, _recent_history(chat_request))
 
-        updated_history = chat_request.chat_history + [
+        new_messages = [
             ChatMessage(role="user", content=chat_request.message),
             ChatMessage(role="assistant", content=response)
         ]
 
-        conn = sqlite3.connect('agents.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO chat_history (id, agent_id, user_id, messages, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (f"chat_{chat_request.agent_id}_{user_id}", chat_request.agent_id, user_id, 
-      json.dumps([msg.dict() for msg in updated_history]), datetime.now()))
-        conn.commit()
-        conn.close()
+        # Only this turn's messages are written and returned; the full history is in chat_messages
+        await aappend_messages(chat_request.agent_id, user_id, new_messages)
 
         return {
             "response": response,
-            "chat_history": [msg.dict() for msg in updated_history]
+            "messages": [msg.dict() for msg in new_messages]
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ ERROR in chat_with_agent:", str(e)) 
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def stream_chat_with_agent(
+    chat_request: ChatRequest,
+    user: dict = Depends(auth_dependencies.get_current_user)
+):
+    user_id = user["sub"]
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing user ID in token")
+
+    # Only admins or assigned users can chat with this agent
+    if user["role"] != "admin":
+        if not await assignment_cache.is_assigned(user_id, chat_request.agent_id):
+            raise HTTPException(status_code=403, detail="You are not authorized to chat with this agent.")
+
+    version = await db.run(get_agent_version, chat_request.agent_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    agent = get_or_create_agent(chat_request.agent_id, user_id, version)
+
+    async def event_stream():
+        try:
+            response = ""
+            async for event, data in agent.astream_chat(chat_request.message, _recent_history(chat_request)):
+                if event == "answer":
+                    response = data["content"]
+                else:
+                    yield _sse(event, data)
+
+            new_messages = [
+                ChatMessage(role="user", content=chat_request.message),
+                ChatMessage(role="assistant", content=response)
+            ]
+            await aappend_messages(chat_request.agent_id, user_id, new_messages)
+
+            yield _sse("history", {
+                "response": response,
+                "messages": [msg.dict() for msg in new_messages]
+            })
+        except Exception as e:
+            print("❌ ERROR in stream_chat_with_agent:", str(e))
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/executor/stats")
+async def get_executor_stats(user=Depends(auth_dependencies.require_role("admin"))):
+    return inference_executor.stats()
+
+
+@router.get("/pool/stats")
+async def get_agent_pool_stats(user=Depends(auth_dependencies.require_role("admin"))):
+    return get_pool_stats()
+
+
+@router.get("/embedding-cache/stats")
+async def get_embedding_cache_statistics(user=Depends(auth_dependencies.require_role("admin"))):
+    return {"caches": await db.run(get_embedding_cache_stats)}
+
+
+@router.get("/extraction-cache/stats")
+async def get_extraction_cache_statistics(user=Depends(auth_dependencies.require_role("admin"))):
+    return await db.run(extraction_cache.stats)
+
+
+@router.get("/assignment-cache/stats")
+async def get_assignment_cache_statistics(user=Depends(auth_dependencies.require_role("admin"))):
+    return assignment_cache.stats()
+
+
+@router.get("/answer-cache/stats")
+async def get_answer_cache_statistics(user=Depends(auth_dependencies.require_role("admin"))):
+    return answer_cache.stats()
+
+
+@router.get("/context/stats")
+async def get_context_packing_statistics(user=Depends(auth_dependencies.require_role("admin"))):
+    return get_packing_stats()
+
 
 @router.get("/{agent_id}")
-async def get_chat_history(agent_id: str, user=Depends(auth_dependencies.get_current_user)):
+async def get_chat_history(
+    agent_id: str,
+    limit: int = Query(DEFAULT_HISTORY_LIMIT, ge=1, le=1000),
+    before: Optional[int] = None,
+    user=Depends(auth_dependencies.get_current_user)
+):
     user_id = user["sub"]
     role = user["role"]
 
     if role != "admin":
-        assigned_agents = ReActAgent.get_assigned_agents(user_id)
-        if agent_id not in assigned_agents:
+        if not await assignment_cache.is_assigned(user_id, agent_id):
             raise HTTPException(status_code=403, detail="Access denied to chat history.")
 
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT messages FROM chat_history WHERE agent_id = ? AND user_id = ?', 
-                   (agent_id, user_id))
-    result = cursor.fetchone()
-    conn.close()
-
-    if result:
-        return {"chat_history": json.loads(result[0])}
-    else:
-        return {"chat_history": []}
+    messages, next_before = await aget_messages(agent_id, user_id, limit, before)
+    return {"chat_history": messages, "next_before": next_before}
 
 @router.post("/{agent_id}/upload")
 async def upload_multiple_files(
@@ -95,45 +192,17 @@ async def upload_multiple_files(
     if not user_id:
         raise HTTPException(status_code=401, detail="user_id missing in token")
 
-    all_chunks = []
-
-    for file in files:
-        pdf_content = await file.read()
-        text = pdf_processor.extract_text_from_pdf(pdf_content)
-        chunks = pdf_processor.text_splitter.split_text(text)
-        all_chunks.extend(chunks)
-
-    if not all_chunks:
-        raise HTTPException(status_code=400, detail="No valid text found in PDFs.")
-
-    index_path = f"data/vectors/{agent_id}"
-
-    # ✅ Check if an index already exists for this agent
-    if os.path.exists(index_path):
-        vectorstore = FAISS.load_local(
-            index_path,
-            pdf_processor.embeddings,
-            allow_dangerous_deserialization=True
-        )
-        vectorstore.add_texts(all_chunks)
-    else:
-        vectorstore = FAISS.from_texts(all_chunks, pdf_processor.embeddings)
-
-    # ✅ Save (or overwrite) the updated index
-    vectorstore.save_local(index_path)
-
-    # Update DB if needed (optional, since path stays same)
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE agents SET vector_index_path = ? WHERE id = ?",
-        (index_path, agent_id)
-    )
-    conn.commit()
-    conn.close()
+    if not await db.afetchone("SELECT id FROM agents WHERE id = ?", (agent_id,)):
+        raise HTTPException(status_code=404, detail="Agent not found")
 
-    agent_pool.pop((agent_id, user_id), None)
+    # Spool to disk and hand extraction, OCR and embedding to a background job
+    uploads = await spool_uploads(files)
+    try:
+        job_id = await aenqueue_job("upload", agent_id, user_id, uploads)
+    except Exception:
+        remove_uploads(uploads)
+        raise
 
-    return {"message": f"{len(files)} PDFs processed and added to existing retriever."}
+    return {"message": f"{len(files)} PDFs queued for processing.", "job_id": job_id}
 
 
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, UploadFile, Form, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, Form, File
 from app.models.chat import EmailRequest
-from app.services.email_sender import send_real_email
+from app.core.database import db
+from app.services.mail_queue import aenqueue_email, get_email
 from app.dependencies.auth_dependencies import AuthDependencies
 import logging
 
@@ -17,8 +18,17 @@ async def send_email(
     user: dict = Depends(AuthDependencies().get_current_user)
 ):
     try:
-        send_real_email(to, subject, body, files)
-        return {"message": "Email sent successfully"}
+        attachments = [(file.filename, await file.read()) for file in files]
+        # Delivery happens in the background; poll /emails/{message_id} for the outcome
+        message_id = await aenqueue_email(user["sub"], to, subject, body, attachments)
+        return {"message": "Email queued", "message_id": message_id}
     except Exception as e:
         logging.error(f"Email sending failed: {str(e)}")
         raise
+
+@router.get("/emails/{message_id}")
+async def get_email_status(message_id: str, user: dict = Depends(auth_dependencies.get_current_user)):
+    email = await db.run(get_email, message_id)
+    if not email or (user["role"] != "admin" and email["user_id"] != user["sub"]):
+        raise HTTPException(status_code=404, detail="Email not found")
+    return email
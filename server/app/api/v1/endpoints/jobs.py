@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from app.core.database import db
+from app.services.ingestion_jobs import get_job, list_jobs
+from app.dependencies.auth_dependencies import AuthDependencies
+
+router = APIRouter()
+
+auth_dependencies = AuthDependencies()
+
+
+@router.get("/")
+async def get_jobs(
+    agent_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(auth_dependencies.get_current_user)
+):
+    # Non-admins only see the jobs they submitted
+    user_id = None if user["role"] == "admin" else user["sub"]
+    return {"jobs": await db.run(list_jobs, agent_id, user_id, limit)}
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, user=Depends(auth_dependencies.get_current_user)):
+    job = await db.run(get_job, job_id)
+    if not job or (user["role"] != "admin" and job["user_id"] != user["sub"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
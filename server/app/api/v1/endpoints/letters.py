@@ -1,13 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.dependencies.auth_dependencies import AuthDependencies
-from app.models.chat import TemplateRequest
+from app.models.chat import TemplateRequest, BulkLetterRequest
+from app.core.config import MAIL_MERGE_MAX_RECIPIENTS, MAIL_MERGE_CHUNK_SIZE
+from app.core.database import db
 from app.services.agent_runner import ReActAgent
 from app.models.chat import GeneratedMessageRequest, ChatMessage
 from app.services.rag_engine import get_or_create_agent
 from app.fill_docx.offer import generate_offer_letter_docx, generate_confirmation_letter_docx
 from fastapi.responses import StreamingResponse
 from app.templates.letter_templates import TEMPLATES
-import io
+from app.services.mail_merge import LETTER_RENDERERS, render_letters, template_fields
+from app.services.mail_queue import aenqueue_emails, list_batch_emails
+import io, uuid
 
 router = APIRouter()
 auth_dependencies = AuthDependencies()
@@ -45,3 +49,77 @@ def generate_template(
         except KeyError as e:
             raise HTTPException(status_code=400, detail=f"Missing field: {str(e)}")
 
+
+@router.post("/bulk")
+async def send_bulk_letters(
+    data: BulkLetterRequest,
+    user: dict = Depends(auth_dependencies.get_current_user)
+):
+    if data.template_type not in LETTER_RENDERERS:
+        raise HTTPException(status_code=400, detail=f"template_type must be one of: {', '.join(LETTER_RENDERERS)}")
+    if not data.recipients:
+        raise HTTPException(status_code=400, detail="No recipients given")
+    if len(data.recipients) > MAIL_MERGE_MAX_RECIPIENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAIL_MERGE_MAX_RECIPIENTS} recipients per request")
+    try:
+        # Validated once for the whole batch rather than failing every recipient alike
+        needed = template_fields(data.subject) | template_fields(data.body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid subject or body: {e}")
+
+    batch_id = str(uuid.uuid4())
+    results = []
+    queued = 0
+    # Rendered and queued a chunk at a time, so only one chunk of letters is in
+    # memory and no single insert holds the write lock for the whole batch
+    for start in range(0, len(data.recipients), MAIL_MERGE_CHUNK_SIZE):
+        recipients = data.recipients[start:start + MAIL_MERGE_CHUNK_SIZE]
+        letters = await render_letters(data.template_type, [recipient.fields for recipient in recipients])
+
+        emails = []
+        for recipient, (docx_bytes, error) in zip(recipients, letters):
+            result = {"to": recipient.to, "status": "failed", "message_id": None, "error": error}
+            results.append(result)
+            if error:
+                continue
+            missing = sorted(needed - recipient.fields.keys())
+            if missing:
+                result["error"] = f"Missing field(s): {', '.join(missing)}"
+                continue
+            try:
+                subject = data.subject.format_map(recipient.fields)
+                body = data.body.format_map(recipient.fields)
+            except (KeyError, IndexError, ValueError, AttributeError) as e:
+                # e.g. a numeric format spec applied to a text value
+                result["error"] = f"Could not fill subject or body: {e}"
+                continue
+            emails.append((result, (recipient.to, subject, body, [(f"{data.template_type}.docx", docx_bytes)])))
+
+        if not emails:
+            continue
+        enqueued = await aenqueue_emails(user["sub"], [email for _, email in emails], batch_id)
+        for (result, _), (message_id, error) in zip(emails, enqueued):
+            if error:
+                result["error"] = error
+                continue
+            result.update(status="queued", message_id=message_id)
+            queued += 1
+
+    return {
+        "batch_id": batch_id,
+        "queued": queued,
+        "failed": len(results) - queued,
+        "results": results,
+    }
+
+
+@router.get("/bulk/{batch_id}")
+async def get_bulk_letters_status(batch_id: str, user: dict = Depends(auth_dependencies.get_current_user)):
+    emails = await db.run(list_batch_emails, batch_id)
+    if not emails or (user["role"] != "admin" and emails[0]["user_id"] != user["sub"]):
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts = {}
+    for email in emails:
+        counts[email["status"]] = counts.get(email["status"], 0) + 1
+    return {"batch_id": batch_id, "counts": counts, "emails": emails}
@@ -3,6 +3,8 @@ from app.auth_helpers.auth import Auth
 from app.dependencies.auth_dependencies import AuthDependencies
 from app.models.chat import LoginResponse, UpdateProfileRequest
 import sqlite3, uuid
+from app.core.database import db
+from app.services.bounded_executor import password_executor
 from pydantic import EmailStr
 
 router = APIRouter()
@@ -10,7 +12,7 @@ router = APIRouter()
 auth_dependencies = AuthDependencies()
 
 @router.post("/register")
-def register_user(
+async def register_user(
     username: str = Form(...), 
     password: str = Form(...), 
     email: EmailStr = Form(...),
@@ -19,36 +21,35 @@ def register_user(
     if role not in ["customer"]:
         raise HTTPException(status_code=400, detail="You can only self-register as a customer")
 
-    conn = sqlite3.connect("agents.db")
-    cursor = conn.cursor()
     user_id = str(uuid.uuid4())
 
-    hashed = Auth.hash_password(password)
+    hashed = await password_executor.run(Auth.hash_password, password)
     try:
-        cursor.execute(
+        await db.aexecute(
             "INSERT INTO users (id, username, password, email, role) VALUES (?, ?, ?, ?, ?)",
             (user_id, username, hashed, email, role),
         )
-        conn.commit()
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Username already exists")
-    finally:
-        conn.close()
 
     return {"message": "User registered", "user_id": user_id}
 
 @router.post("/login", response_model=LoginResponse)
-def login(username: str = Form(...), password: str = Form(...)):
-    conn = sqlite3.connect("agents.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, password, role FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user or not Auth.verify_password(password, user[1]):
+async def login(username: str = Form(...), password: str = Form(...)):
+    user = await db.afetchone("SELECT id, password, role FROM users WHERE username = ?", (username,))
+
+    if not user or not await password_executor.run(Auth.verify_password, password, user[1]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    user_id, _, role = user
+    user_id, hashed, role = user
+
+    # Upgrade hashes made with a different cost while we have the plain password
+    if Auth.needs_rehash(hashed):
+        rehashed = await password_executor.run(Auth.hash_password, password)
+        await db.aexecute(
+            "UPDATE users SET password = ? WHERE id = ? AND password = ?", (rehashed, user_id, hashed)
+        )
+
     token = Auth.create_access_token({"sub": user_id, "role": role})
     return {
         "access_token": token,
@@ -58,7 +59,7 @@ def login(username: str = Form(...), password: str = Form(...)):
     }
 
 @router.post("/create-user")
-def create_employee(
+async def create_employee(
     username: str = Form(...), 
     password: str = Form(...), 
     role: str = Form(...),
@@ -67,49 +68,39 @@ def create_employee(
     if role not in ['employee', 'customer']:
         raise HTTPException(status_code=400, detail="Invalid role")
     
-    conn = sqlite3.connect("agents.db")
-    cursor = conn.cursor()
     user_id = str(uuid.uuid4())
 
-    hashed = Auth.hash_password(password)
+    hashed = await password_executor.run(Auth.hash_password, password)
     try:
-        cursor.execute(
+        await db.aexecute(
             "INSERT INTO users (id, username, password, role) VALUES (?, ?, ?, ?)",
             (user_id, username, hashed, role),
         )
-        conn.commit()
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Username already exists")
-    finally:
-        conn.close()
 
     return {"message": "User created", "user_id": user_id}
 
 @router.get("/users")
 async def get_users(user=Depends(auth_dependencies.require_role("admin"))):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username, role FROM users")
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await db.afetchall("SELECT id, username, role FROM users")
 
     users = [{"id": row[0], "name": row[1], "role": row[2]} for row in rows]
     return {"users": users}
 
+@router.get("/users/password-hashing/stats")
+async def get_password_hashing_stats(user=Depends(auth_dependencies.require_role("admin"))):
+    return password_executor.stats()
+
 @router.get("/profile")
 def get_profile(user: dict = Depends(auth_dependencies.get_current_user)):
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
-
     user_id = user["sub"]
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID missing in token")
 
-    cursor.execute(
+    row = db.fetchone(
         "SELECT firstname, lastname, username, email, role FROM users WHERE id = ?", (user_id,)
     )
-    row = cursor.fetchone()
-    conn.close()
 
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
@@ -123,18 +114,13 @@ def get_profile(user: dict = Depends(auth_dependencies.get_current_user)):
     }
 
 @router.put("/profile")
-def update_profile(data: UpdateProfileRequest, user: dict = Depends(auth_dependencies.get_current_user)):
+async def update_profile(data: UpdateProfileRequest, user: dict = Depends(auth_dependencies.get_current_user)):
     user_id = user["sub"]
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID missing in token")
 
-    conn = sqlite3.connect("agents.db")
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT password FROM users WHERE id = ?", (user_id,))
-    result = cursor.fetchone()
+    result = await db.afetchone("SELECT password FROM users WHERE id = ?", (user_id,))
     if not result:
-        conn.close()
         raise HTTPException(status_code=404, detail="User not found")
 
     current_hashed_pw = result[0]
@@ -142,10 +128,8 @@ def update_profile(data: UpdateProfileRequest, user: dict = Depends(auth_depende
     # Validate old_password if new_password provided
     if data.new_password:
         if not data.old_password:
-            conn.close()
             raise HTTPException(status_code=400, detail="Old password is required to change password")
-        if not Auth.verify_password(data.old_password, current_hashed_pw):
-            conn.close()
+        if not await password_executor.run(Auth.verify_password, data.old_password, current_hashed_pw):
             raise HTTPException(status_code=401, detail="Old password is incorrect")
 
     update_fields = []
@@ -164,15 +148,13 @@ def update_profile(data: UpdateProfileRequest, user: dict = Depends(auth_depende
         values.append(data.email)
 
     if data.new_password is not None:
-        new_hashed_pw = Auth.hash_password(data.new_password)
+        new_hashed_pw = await password_executor.run(Auth.hash_password, data.new_password)
         update_fields.append("password = ?")
         values.append(new_hashed_pw)
 
     if update_fields:
         sql = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
         values.append(user_id)
-        cursor.execute(sql, values)
-        conn.commit()
+        await db.aexecute(sql, values)
 
-    conn.close()
     return {"message": "Profile updated successfully"}
\ No newline at end of file
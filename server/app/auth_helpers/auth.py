@@ -2,6 +2,8 @@ import bcrypt
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 
+from app.core.config import BCRYPT_ROUNDS
+
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
@@ -9,12 +11,20 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 class Auth:
     @staticmethod
     def hash_password(password: str) -> str:
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode()
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
     @staticmethod
     def verify_password(plain: str, hashed: str) -> bool:
         return bcrypt.checkpw(plain.encode('utf-8'), hashed.encode('utf-8'))
 
+    @staticmethod
+    def needs_rehash(hashed: str) -> bool:
+        # Hashes look like $2b$<cost>$<salt+digest>
+        try:
+            return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+        except (IndexError, ValueError):
+            return True
+
     @staticmethod
     def create_access_token(data: dict, expires_delta: timedelta = None):
         to_encode = data.copy()
@@ -1,10 +1,124 @@
 import os
-import sqlite3
 import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Database settings
+DB_PATH = os.getenv("DB_PATH", "agents.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+# Agent inference executor
+CHAT_EXECUTOR_WORKERS = int(os.getenv("CHAT_EXECUTOR_WORKERS", "16"))
+CHAT_EXECUTOR_MAX_QUEUE = int(os.getenv("CHAT_EXECUTOR_MAX_QUEUE", "200"))
+
+# Most recent chat messages accepted with a request; older ones live in chat_messages
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "20"))
+
+# Cached agent assignments for chat authorization (ASSIGNMENT_CACHE_MAX_USERS=0 disables it)
+ASSIGNMENT_CACHE_TTL_SECONDS = int(os.getenv("ASSIGNMENT_CACHE_TTL_SECONDS", "60"))
+ASSIGNMENT_CACHE_MAX_USERS = int(os.getenv("ASSIGNMENT_CACHE_MAX_USERS", "10000"))
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Agent session pool
+AGENT_POOL_MAX_ENTRIES = int(os.getenv("AGENT_POOL_MAX_ENTRIES", "1000"))
+AGENT_POOL_MAX_BYTES = int(os.getenv("AGENT_POOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+AGENT_POOL_IDLE_MINUTES = int(os.getenv("AGENT_POOL_IDLE_MINUTES", "30"))
+AGENT_POOL_SWEEP_SECONDS = int(os.getenv("AGENT_POOL_SWEEP_SECONDS", "60"))
+
+# Embedding cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# Segmented vector indexes
+VECTOR_COMPACT_MIN_SEGMENTS = int(os.getenv("VECTOR_COMPACT_MIN_SEGMENTS", "4"))
+VECTOR_COMPACT_INTERVAL_SECONDS = int(os.getenv("VECTOR_COMPACT_INTERVAL_SECONDS", "300"))
+# Retired segment files are kept this long so other workers can drop their (mapped) copies
+VECTOR_RETIRED_GRACE_SECONDS = int(os.getenv("VECTOR_RETIRED_GRACE_SECONDS", "900"))
+
+# FAISS index type for new agents: auto, flat, hnsw, hnsw_sq8, ivf, ivf_sq8 or ivf_pq.
+# "auto" stays exact below VECTOR_HNSW_MIN_VECTORS and compresses above VECTOR_IVF_MIN_VECTORS.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+VECTOR_HNSW_MIN_VECTORS = int(os.getenv("VECTOR_HNSW_MIN_VECTORS", "20000"))
+VECTOR_IVF_MIN_VECTORS = int(os.getenv("VECTOR_IVF_MIN_VECTORS", "500000"))
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+# Open indexes read-only via mmap so uvicorn workers share them through the page cache
+VECTOR_INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "1") == "1"
+
+# PDF extraction
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_OCR_CONCURRENCY = int(os.getenv("PDF_OCR_CONCURRENCY", str(PDF_EXTRACT_WORKERS)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "data/extraction_cache.db")
+EXTRACTION_CACHE_MAX_PAGES = int(os.getenv("EXTRACTION_CACHE_MAX_PAGES", "250000"))
+
+# Upload spooling
+UPLOAD_DIR = "data/pdfs"
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", "100")) * 1024 * 1024
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", "500")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Background ingestion jobs
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_POLL_SECONDS = float(os.getenv("INGESTION_POLL_SECONDS", "2"))
+# A running job's worker renews its lease every third of this; other workers reclaim it once it lapses
+INGESTION_LEASE_SECONDS = int(os.getenv("INGESTION_LEASE_SECONDS", "120"))
+
+# Outbound mail queue; APP_PASSWORD may be empty for relays without authentication
+APP_EMAIL = os.getenv("APP_EMAIL")
+APP_PASSWORD = os.getenv("APP_PASSWORD")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "1") == "1"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+MAIL_CONNECTIONS = int(os.getenv("MAIL_CONNECTIONS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_BACKOFF_SECONDS = int(os.getenv("MAIL_BACKOFF_SECONDS", "30"))
+MAIL_POLL_SECONDS = float(os.getenv("MAIL_POLL_SECONDS", "5"))
+MAIL_IDLE_SECONDS = float(os.getenv("MAIL_IDLE_SECONDS", "60"))
+MAIL_STALE_SECONDS = int(os.getenv("MAIL_STALE_SECONDS", "600"))
+# Matches common provider limits; larger messages are refused before they are queued
+MAIL_MAX_MESSAGE_BYTES = int(os.getenv("MAIL_MAX_MESSAGE_MB", "25")) * 1024 * 1024
+# Sent and failed messages are deleted this long after their last attempt
+MAIL_RETENTION_DAYS = int(os.getenv("MAIL_RETENTION_DAYS", "30"))
+MAIL_SWEEP_SECONDS = int(os.getenv("MAIL_SWEEP_SECONDS", "300"))
+
+# Bulk letter mail-merge
+MAIL_MERGE_WORKERS = int(os.getenv("MAIL_MERGE_WORKERS", str(os.cpu_count() or 1)))
+MAIL_MERGE_MAX_RECIPIENTS = int(os.getenv("MAIL_MERGE_MAX_RECIPIENTS", "1000"))
+# Recipients rendered and queued together; bounds the letters held in memory and each insert
+MAIL_MERGE_CHUNK_SIZE = int(os.getenv("MAIL_MERGE_CHUNK_SIZE", "50"))
+
+# Per-agent semantic answer cache (ANSWER_CACHE_MAX_ENTRIES=0 disables it)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# Retrieved context packed into each prompt
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+CONTEXT_MIN_RELEVANCE = float(os.getenv("CONTEXT_MIN_RELEVANCE", "0.3"))
+
+# Embedding backend for new agents: "openai" or the local "hashing" vectorizer
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_HASH_DIM = int(os.getenv("EMBEDDING_HASH_DIM", "1024"))
+
+# Embedding API calls during ingestion
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_API_BASE = os.getenv("EMBEDDING_API_BASE")
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", "1"))
+
 # Initialize folders
 os.makedirs("data/agents", exist_ok=True)
 os.makedirs("data/vectors", exist_ok=True)
@@ -12,8 +126,22 @@ os.makedirs("data/pdfs", exist_ok=True)
 
 # DB init
 def init_db():
-    conn = sqlite3.connect('agents.db')
-    cursor = conn.cursor()
+    from app.core.database import db
+    from app.services.chat_store import migrate_legacy_history
+    from app.services.vector_index import register_legacy_indexes
+
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        _create_schema(cursor)
+        migrate_legacy_history(cursor)
+        register_legacy_indexes(cursor)
+
+def _add_column(cursor, table: str, column: str, definition: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _create_schema(cursor):
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS agents (
@@ -23,9 +151,17 @@ def init_db():
             tools TEXT NOT NULL,
             system_prompt TEXT NOT NULL,
             vector_index_path TEXT,
+            embedding_backend TEXT NOT NULL DEFAULT 'openai',
+            index_type TEXT NOT NULL DEFAULT 'auto',
+            version INTEGER NOT NULL DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # Agents created before backends were selectable were all embedded with OpenAI
+    _add_column(cursor, "agents", "embedding_backend", "TEXT NOT NULL DEFAULT 'openai'")
+    _add_column(cursor, "agents", "index_type", "TEXT NOT NULL DEFAULT 'auto'")
+    # Bumped on every change so each worker process can tell its cached copy is stale
+    _add_column(cursor, "agents", "version", "INTEGER NOT NULL DEFAULT 1")
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS chat_history (
@@ -38,6 +174,79 @@ def init_db():
         )
     ''')
 
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (agent_id, user_id, seq),
+            FOREIGN KEY (agent_id) REFERENCES agents (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vector_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            kind TEXT CHECK(kind IN ('base', 'segment')) NOT NULL,
+            chunks INTEGER NOT NULL DEFAULT 0,
+            index_type TEXT NOT NULL DEFAULT 'flat',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            retired_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_vector_segments_agent ON vector_segments (agent_id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT CHECK(kind IN ('create_agent', 'upload', 'reindex')) NOT NULL,
+            agent_id TEXT NOT NULL,
+            user_id TEXT,
+            status TEXT CHECK(status IN ('queued', 'running', 'completed', 'failed')) NOT NULL,
+            files TEXT NOT NULL,
+            payload TEXT,
+            files_total INTEGER NOT NULL DEFAULT 0,
+            files_done INTEGER NOT NULL DEFAULT 0,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            chunks_total INTEGER NOT NULL DEFAULT 0,
+            embeddings_done INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            worker_id TEXT,
+            lease_expires_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs (status, created_at)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbound_emails (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            sender TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT,
+            message BLOB NOT NULL,
+            status TEXT CHECK(status IN ('queued', 'sending', 'sent', 'failed')) NOT NULL,
+            batch_id TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbound_emails_status ON outbound_emails (status, next_attempt_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbound_emails_batch ON outbound_emails (batch_id)')
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
@@ -55,7 +264,7 @@ def init_db():
     cursor.execute("SELECT * FROM users WHERE role = 'admin'")
     if not cursor.fetchone():
         import bcrypt
-        admin_pw = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        admin_pw = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
         cursor.execute('''
             INSERT INTO users (id, username, password, email, role) VALUES (?, ?, ?, ?, ?)
         ''', (str(uuid.uuid4()), 'admin', admin_pw, 'admin@learn.com', 'admin'))
@@ -70,6 +279,7 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_agents_created_at ON agents (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_agent_assignments_agent ON agent_assignments (agent_id, user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_agent_assignments_user ON agent_assignments (user_id, agent_id)')
@@ -0,0 +1,146 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, List, Optional, Sequence
+
+from app.core.config import DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT
+
+
+# SQLite's default limit on bound parameters is 999 on older builds, so long
+# IN (...) lists are split into batches of this size
+PARAM_BATCH_SIZE = 500
+
+
+class PoolExhaustedError(RuntimeError):
+    """No pooled connection became free within the busy timeout."""
+
+
+class Database:
+    """Bounded pool of SQLite connections shared by every endpoint and service.
+
+    Connections are opened once in WAL mode so readers never block the writer,
+    and statements are reused through sqlite3's per-connection statement cache.
+    The ``a*`` methods run on a dedicated executor sized to the pool, so async
+    handlers never block the event loop on disk I/O.
+    """
+
+    def __init__(self, path: str, pool_size: int = 8, busy_timeout: float = 30.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=pool_size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    # Give the slot back, or every failed connect shrinks the pool for good
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn = self._pool.get(timeout=self.busy_timeout)
+                except queue.Empty:
+                    raise PoolExhaustedError(
+                        f"All {self.pool_size} database connections stayed busy for {self.busy_timeout}s"
+                    ) from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def executemany(self, sql: str, seq_of_params: Sequence[Sequence[Any]]) -> int:
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params).rowcount
+
+    def run_in_transaction(self, fn: Callable[..., Any], *args) -> Any:
+        with self.transaction() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    async def afetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        return await self.run(self.fetchone, sql, params)
+
+    async def afetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        return await self.run(self.fetchall, sql, params)
+
+    async def aexecute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        return await self.run(self.execute, sql, params)
+
+    async def aexecutemany(self, sql: str, seq_of_params: Sequence[Sequence[Any]]) -> int:
+        return await self.run(self.executemany, sql, seq_of_params)
+
+    async def atransaction(self, fn: Callable[..., Any], *args) -> Any:
+        return await self.run(self.run_in_transaction, fn, *args)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._opened = 0
+        self._executor.shutdown(wait=False)
+
+
+db = Database(DB_PATH, pool_size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
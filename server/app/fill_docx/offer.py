@@ -1,6 +1,12 @@
 from docx import Document
-from typing import Dict
+from typing import Dict, Set
 import io
+import re
+
+OFFER_TEMPLATE_PATH = "docx/templates/offer.docx"
+CONFIRMATION_TEMPLATE_PATH = "docx/templates/confirmation.docx"
+
+PLACEHOLDER_PATTERN = re.compile(r"\[([^\[\]]+)\]")
 
 def replace_text_in_paragraph(paragraph, data: Dict[str, str]):
     full_text = ''.join(run.text for run in paragraph.runs)
@@ -15,7 +21,17 @@ def replace_text_in_paragraph(paragraph, data: Dict[str, str]):
             run.text = ''
         paragraph.runs[0].text = full_text
 
-def generate_offer_letter_docx(fields: Dict[str, str], template_path: str = "docx/templates/offer.docx") -> bytes:
+def template_placeholders(template_path: str) -> Set[str]:
+    """Names of the [placeholders] in the template's paragraphs and table cells."""
+    doc = Document(template_path)
+    paragraphs = list(doc.paragraphs)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                paragraphs.extend(cell.paragraphs)
+    return {name for paragraph in paragraphs for name in PLACEHOLDER_PATTERN.findall(paragraph.text)}
+
+def generate_offer_letter_docx(fields: Dict[str, str], template_path: str = OFFER_TEMPLATE_PATH) -> bytes:
     doc = Document(template_path)
 
     for paragraph in doc.paragraphs:
@@ -33,7 +49,7 @@ def generate_offer_letter_docx(fields: Dict[str, str], template_path: str = "doc
     buffer.seek(0)
     return buffer.read()
 
-def generate_confirmation_letter_docx(fields: Dict[str, str], template_path: str = "docx/templates/confirmation.docx") -> bytes:
+def generate_confirmation_letter_docx(fields: Dict[str, str], template_path: str = CONFIRMATION_TEMPLATE_PATH) -> bytes:
     doc = Document(template_path)
 
     for paragraph in doc.paragraphs:
@@ -1,7 +1,18 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import init_db
-from app.api.v1.endpoints import tools, agents, chat, users, letters, email
+from app.core.database import db, PoolExhaustedError
+from app.services.bounded_executor import inference_executor, password_executor
+from app.services.rag_engine import run_pool_sweeper
+from app.services.vector_index import run_compactor
+from app.services.pdf_processor import page_pool
+from app.services.ingestion_jobs import run_ingestion_workers
+from app.services.mail_queue import run_mail_senders
+from app.services.mail_merge import merge_pool
+from app.services.upload_storage import UploadLimitMiddleware
+from app.api.v1.endpoints import tools, agents, chat, users, letters, email, jobs
 
 app = FastAPI(title="Agentic AI Platform", version="1.0.0")
 
@@ -14,6 +25,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Upload size limits apply while the body streams in, before FastAPI parses the form
+app.add_middleware(UploadLimitMiddleware)
+
+@app.exception_handler(PoolExhaustedError)
+async def database_busy(request: Request, exc: PoolExhaustedError):
+    print("❌ ERROR database pool exhausted:", str(exc))
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly."},
+        headers={"Retry-After": "1"},
+    )
+
 # Database setup
 init_db()
 
@@ -24,6 +47,26 @@ app.include_router(chat.router, prefix="/chat", tags=["Chat"])
 app.include_router(users.router, tags=["Users"])
 app.include_router(letters.router, prefix="/letters", tags=["Letters"])
 app.include_router(email.router, tags=["Email"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
+
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(run_pool_sweeper()))
+    background_tasks.append(asyncio.create_task(run_compactor()))
+    background_tasks.append(asyncio.create_task(run_ingestion_workers()))
+    background_tasks.append(asyncio.create_task(run_mail_senders()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    inference_executor.shutdown()
+    password_executor.shutdown()
+    page_pool.shutdown()
+    merge_pool.shutdown()
+    db.close()
 
 @app.get("/")
 async def root():
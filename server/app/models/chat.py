@@ -24,6 +24,9 @@ class AgentUpdateRequest(BaseModel):
     tools: Optional[List[str]] = None
     assigned_user_ids: Optional[List[str]] = None
 
+class AgentReindexRequest(BaseModel):
+    index_type: str
+
 class UpdateProfileRequest(BaseModel):
     firstname: str | None = None
     lastname: str | None = None
@@ -35,6 +38,17 @@ class TemplateRequest(BaseModel):
     template_type: str
     fields: Dict[str, Any]
 
+class BulkLetterRecipient(BaseModel):
+    to: EmailStr
+    fields: Dict[str, Any]
+
+class BulkLetterRequest(BaseModel):
+    template_type: str
+    # May use {placeholders} from each recipient's fields
+    subject: str
+    body: str
+    recipients: List[BulkLetterRecipient]
+
 class TemplateResponse(BaseModel):
     content: str
 
@@ -2,4 +2,19 @@ from . import agent_runner
 from . import rag_engine
 from . import pdf_processor
 from . import prompt_generator
-from . import tools_repo
\ No newline at end of file
+from . import tools_repo
+from . import chat_store
+from . import bounded_executor
+from . import embedding_cache
+from . import vector_index
+from . import extraction_cache
+from . import upload_storage
+from . import ingestion_jobs
+from . import embedding_pipeline
+from . import embedding_backends
+from . import answer_cache
+from . import context_packer
+from . import agent_versions
+from . import assignment_cache
+from . import mail_queue
+from . import mail_merge
\ No newline at end of file
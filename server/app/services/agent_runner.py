@@ -1,69 +1,137 @@
 import json
 import os
-import sqlite3
-from typing import List
+import threading
+import time
+from typing import AsyncIterator, List, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_community.vectorstores import FAISS
 from langchain.agents import initialize_agent, AgentType
-from langchain.memory import ConversationBufferMemory
 from langchain.tools import Tool
 from langchain.chains import RetrievalQA
 from langchain.tools import tool
+from langchain.schema import HumanMessage, SystemMessage
 
 from app.services.tools_repo import ToolsRepository
 from app.services.pdf_processor import PDFProcessor
 from app.models.chat import ChatMessage
+from app.core.database import db
+from app.services.bounded_executor import inference_executor
+from app.services.vector_index import load_agent_index
+from app.services.embedding_backends import get_embedding_backend
+from app.services.answer_cache import answer_cache
+from app.services.context_packer import pack_context, join_context
+from app.core.config import CONTEXT_CANDIDATES
 
 tools_repo = ToolsRepository()
 pdf_processor = PDFProcessor()
 
-class ReActAgent:
+FALLBACK_ANSWER = "Sorry, I can't provide a valid answer for that question. Would you like to chat with a live agent?"
+NO_KNOWLEDGE_ANSWER = "There is no knowledge base available."
+
+# Rough fixed cost of one per-user session, used for pool memory accounting
+SESSION_BASE_BYTES = 16 * 1024
+
+# Same instructions RetrievalQA's "stuff" chain uses for chat models
+QA_SYSTEM_TEMPLATE = """Use the following pieces of context to answer the user's question. 
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+----------------
+{context}"""
+
+class AgentRuntime:
+    """Retrieval state for one agent, shared by every user chatting with it.
+
+    Holds the loaded vector store, the prebuilt RetrievalQA chain and the
+    agent's tools. ``ref_count`` tracks how many ReActAgent sessions use it.
+    """
+
     def __init__(self, agent_id: str):
         self.agent_id = agent_id
         self.llm = ChatOpenAI(temperature=0.2, model="gpt-4o-mini")
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-        self.agent_executor = None
+        self.tools: List[Tool] = []
+        self.system_prompt = None
+        self.vectorstore = None
         self.retriever = None
+        self.qa_chain = None
+        self.loaded = False
+        self.ref_count = 0
+        self.estimated_bytes = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+
+            result = db.fetchone('''
+                SELECT name, description, tools, system_prompt, vector_index_path, embedding_backend
+                FROM agents WHERE id = ?
+            ''', (self.agent_id,))
+
+            if not result:
+                raise ValueError(f"Agent {self.agent_id} not found")
+
+            name, description, tools_str, system_prompt, vector_index_path, embedding_backend = result
+            tool_names = json.loads(tools_str)
+            self.tools = tools_repo.get_tools_by_names(tool_names)
+            self.system_prompt = system_prompt
+
+            # Add retrieval tool if vector index exists
+            if vector_index_path:
+                self.vectorstore = load_agent_index(self.agent_id, get_embedding_backend(embedding_backend))
+
+            if self.vectorstore:
+                self.retriever = self.vectorstore.as_retriever()
+                self.qa_chain = RetrievalQA.from_chain_type(
+                    llm=self.llm,
+                    retriever=self.retriever,
+                    chain_type="stuff",
+                    return_source_documents=True
+                )
+
+                vectorstore = self.vectorstore
+
+                @tool
+                def knowledge_retriever(query: str) -> str:
+                    """Retrieve relevant information from the uploaded company PDFs based on the user's question."""
+                    docs = pack_context(query, vectorstore.similarity_search_with_score(query, k=CONTEXT_CANDIDATES))
+                    return join_context(docs)
+
+                self.tools.append(knowledge_retriever)
+
+            self.estimated_bytes = self._estimate_bytes()
+            self.loaded = True
+
+    def _estimate_bytes(self) -> int:
+        return self.vectorstore.estimate_bytes() if self.vectorstore else 0
+
+
+class ReActAgent:
+    def __init__(self, agent_id: str, runtime: AgentRuntime = None):
+        self.agent_id = agent_id
+        self.runtime = runtime or AgentRuntime(agent_id)
+        self.agent_executor = None
+
+    def estimate_bytes(self) -> int:
+        # Answers come from standalone retrieval QA prompts, so a session keeps no
+        # conversation and its footprint does not grow however long the user chats
+        return SESSION_BASE_BYTES
+
+    @property
+    def llm(self):
+        return self.runtime.llm
+
+    @property
+    def retriever(self):
+        return self.runtime.retriever
 
     def load_agent_config(self):
-        conn = sqlite3.connect('agents.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT name, description, tools, system_prompt, vector_index_path
-            FROM agents WHERE id = ?
-        ''', (self.agent_id,))
-        result = cursor.fetchone()
-        conn.close()
-
-        if not result:
-            raise ValueError(f"Agent {self.agent_id} not found")
-
-        name, description, tools_str, system_prompt, vector_index_path = result
-        tool_names = json.loads(tools_str)
-        tools = tools_repo.get_tools_by_names(tool_names)
-
-        # Add retrieval tool if vector index exists
-        if vector_index_path and os.path.exists(vector_index_path):
-            vectorstore = FAISS.load_local(vector_index_path, pdf_processor.embeddings, allow_dangerous_deserialization=True)
-            self.retriever = vectorstore.as_retriever()
-
-            @tool
-            def knowledge_retriever(query: str) -> str:
-                """Retrieve relevant information from the uploaded company PDFs based on the user's question."""
-                if self.retriever:
-                    docs = self.retriever.get_relevant_documents(query)
-                    return "\n\n".join([doc.page_content for doc in docs[:3]])
-                return "No knowledge base available."
-
-            tools.append(knowledge_retriever)
+        self.runtime.load()
 
         # Create agent using OpenAI Functions agent type
         self.agent_executor = initialize_agent(
-            tools=tools,
+            tools=self.runtime.tools,
             llm=self.llm,
             agent=AgentType.OPENAI_FUNCTIONS,
-            memory=self.memory,
             verbose=True,
             max_iterations=30,
             max_execution_time=60,
@@ -72,41 +140,104 @@ class ReActAgent:
 
     def _retrieve_knowledge(self, query: str) -> str:
         if self.retriever:
-            docs = self.retriever.get_relevant_documents(query)
+            docs = pack_context(query, self.runtime.vectorstore.similarity_search_with_score(query, k=CONTEXT_CANDIDATES))
             for i, doc in enumerate(docs):
                 print(f"[Retriever Doc {i+1}]\n{doc.page_content[:300]}\n")
-            return "\n\n".join([doc.page_content for doc in docs[:3]])
+            return join_context(docs)
         return "No knowledge base available."
 
     def chat(self, message: str, chat_history: List[ChatMessage]) -> str:
         # Ensure agent config (retriever) is loaded
-        if not self.retriever:
+        if self.agent_executor is None:
             self.load_agent_config()
 
         # Use retrieval-based QA only
-        if self.retriever:
-            retriever_qa = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                retriever=self.retriever,
-                chain_type="stuff",
-                return_source_documents=True
+        if self.runtime.qa_chain:
+            started = time.monotonic()
+            generation = answer_cache.generation(self.agent_id)
+
+            # The question is embedded once, for the cache lookup and for retrieval
+            vector = self.runtime.vectorstore.embeddings.embed_query(message)
+            cached = answer_cache.lookup(self.agent_id, vector)
+            if cached:
+                return cached.answer
+
+            # Only relevant, de-duplicated text within the token budget reaches the prompt
+            docs = pack_context(
+                message,
+                self.runtime.vectorstore.similarity_search_with_score_by_vector(vector, k=CONTEXT_CANDIDATES),
             )
-            result = retriever_qa.invoke({"query": message})
-            answer = result.get("result", "").strip()
-
-            # You can also check the similarity score or source content length here if needed
-            if len(answer) < 30 or "I'm not sure" in answer or answer.lower().startswith("i don't know"):
-                return "Sorry, I can't provide a valid answer for that question. Would you like to chat with a live agent?"
-            
+            result = self.runtime.qa_chain.combine_documents_chain.invoke(
+                {"input_documents": docs, "question": message}
+            )
+            answer = self._finalize_answer(result.get("output_text", ""))
+            self._cache_answer(message, vector, answer, docs, time.monotonic() - started, generation)
             return answer
 
-        return "There is no knowledge base available."
+        return NO_KNOWLEDGE_ANSWER
+
+    def _cache_answer(self, message: str, vector, answer: str, docs, latency: float, generation: int):
+        if answer != FALLBACK_ANSWER:
+            answer_cache.store(
+                self.agent_id, message, vector, answer,
+                [doc.page_content for doc in docs], latency, generation,
+            )
+
+    async def astream_chat(self, message: str, chat_history: List[ChatMessage]) -> AsyncIterator[Tuple[str, dict]]:
+        """Streaming variant of ``chat`` yielding ``(event, data)`` pairs.
+
+        Emits ``retrieval`` once the context documents are fetched, a ``token``
+        per LLM chunk, and finally ``answer`` with the same post-processed text
+        ``chat`` would have returned.
+        """
+        if self.agent_executor is None:
+            await inference_executor.run(self.load_agent_config)
+
+        if not self.retriever:
+            yield "answer", {"content": NO_KNOWLEDGE_ANSWER}
+            return
+
+        started = time.monotonic()
+        generation = answer_cache.generation(self.agent_id)
+        vectorstore = self.runtime.vectorstore
+        vector = await vectorstore.embeddings.aembed_query(message)
+        cached = answer_cache.lookup(self.agent_id, vector)
+        if cached:
+            yield "retrieval", {"documents": len(cached.sources)}
+            yield "token", {"content": cached.answer}
+            yield "answer", {"content": cached.answer}
+            return
+
+        candidates = await inference_executor.run(
+            vectorstore.similarity_search_with_score_by_vector, vector, CONTEXT_CANDIDATES
+        )
+        docs = pack_context(message, candidates)
+        yield "retrieval", {"documents": len(docs)}
+
+        messages = [
+            SystemMessage(content=QA_SYSTEM_TEMPLATE.format(context=join_context(docs))),
+            HumanMessage(content=message),
+        ]
+
+        answer = ""
+        async for chunk in self.llm.astream(messages):
+            if chunk.content:
+                answer += chunk.content
+                yield "token", {"content": chunk.content}
+
+        answer = self._finalize_answer(answer)
+        self._cache_answer(message, vector, answer, docs, time.monotonic() - started, generation)
+        yield "answer", {"content": answer}
+
+    @staticmethod
+    def _finalize_answer(answer: str) -> str:
+        answer = answer.strip()
+        # You can also check the similarity score or source content length here if needed
+        if len(answer) < 30 or "I'm not sure" in answer or answer.lower().startswith("i don't know"):
+            return FALLBACK_ANSWER
+        return answer
 
     @staticmethod
     def get_assigned_agents(user_id: str) -> List[str]:
-        conn = sqlite3.connect('agents.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT agent_id FROM agent_assignments WHERE user_id = ?", (user_id,))
-        result = cursor.fetchall()
-        conn.close()
+        result = db.fetchall("SELECT agent_id FROM agent_assignments WHERE user_id = ?", (user_id,))
         return [row[0] for row in result]
\ No newline at end of file
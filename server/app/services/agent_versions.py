@@ -0,0 +1,13 @@
+from typing import Optional
+
+from app.core.database import db
+
+
+def bump_agent_version(conn, agent_id: str):
+    """Mark the agent as changed; every process reloads it on its next request."""
+    conn.execute("UPDATE agents SET version = version + 1 WHERE id = ?", (agent_id,))
+
+
+def get_agent_version(agent_id: str) -> Optional[int]:
+    row = db.fetchone("SELECT version FROM agents WHERE id = ?", (agent_id,))
+    return row["version"] if row else None
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[str]
+    latency: float
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class _AgentAnswers:
+    def __init__(self):
+        # Keyed by question text, least recently used first
+        self.entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self.vectors: Dict[str, np.ndarray] = {}
+        self._keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self):
+        if self._matrix is None and self.entries:
+            self._keys = list(self.entries)
+            self._matrix = np.vstack([self.vectors[key] for key in self._keys])
+        return self._keys, self._matrix
+
+    def remove(self, key: str):
+        self.entries.pop(key, None)
+        self.vectors.pop(key, None)
+        self._matrix = None
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+class AnswerCache:
+    """Per-agent cache of answers keyed by question embedding.
+
+    A question whose cosine similarity to a cached one is at least
+    ``threshold`` gets the cached answer. Entries expire after
+    ``ttl_seconds`` and each agent keeps at most ``max_entries``.
+    ``invalidate`` drops an agent's entries whenever its knowledge base or
+    configuration changes.
+    """
+
+    def __init__(self, threshold: float, ttl_seconds: int, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._agents: Dict[str, _AgentAnswers] = {}
+        # Bumped on invalidation so answers computed against an old index are not stored
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def generation(self, agent_id: str) -> int:
+        with self._lock:
+            return self._generations.get(agent_id, 0)
+
+    def _expire(self, answers: _AgentAnswers, now: float):
+        expired = [key for key, entry in answers.entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            answers.remove(key)
+
+    def lookup(self, agent_id: str, vector) -> Optional[CachedAnswer]:
+        if not self.enabled:
+            return None
+        query = _normalize(vector)
+        with self._lock:
+            answers = self._agents.get(agent_id)
+            entry = None
+            if answers:
+                self._expire(answers, time.time())
+                keys, matrix = answers.matrix()
+                if matrix is not None:
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        entry = answers.entries[keys[best]]
+                        answers.entries.move_to_end(keys[best])
+
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.hits += 1
+            self.hits += 1
+            self.latency_saved += entry.latency
+            return entry
+
+    def store(self, agent_id: str, question: str, vector, answer: str, sources: List[str],
+              latency: float, generation: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(agent_id, 0) != generation:
+                return
+            answers = self._agents.setdefault(agent_id, _AgentAnswers())
+            answers.remove(question)
+            answers.entries[question] = CachedAnswer(question, answer, sources, latency)
+            answers.vectors[question] = _normalize(vector)
+            while len(answers.entries) > self.max_entries:
+                answers.remove(next(iter(answers.entries)))
+
+    def invalidate(self, agent_id: str):
+        with self._lock:
+            self._generations[agent_id] = self._generations.get(agent_id, 0) + 1
+            if self._agents.pop(agent_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "agents": len(self._agents),
+                "entries": sum(len(answers.entries) for answers in self._agents.values()),
+                "max_entries_per_agent": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES)
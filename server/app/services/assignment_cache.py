@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from app.core.config import ASSIGNMENT_CACHE_TTL_SECONDS, ASSIGNMENT_CACHE_MAX_USERS
+from app.core.database import db
+
+
+def _load_assignments(user_id: str) -> FrozenSet[str]:
+    rows = db.fetchall("SELECT agent_id FROM agent_assignments WHERE user_id = ?", (user_id,))
+    return frozenset(row[0] for row in rows)
+
+
+class AssignmentCache:
+    """Per-user set of assigned agent ids, so chat authorization skips SQLite.
+
+    Writes in this process invalidate the affected users straight away. A
+    denial is always re-checked against the database, so an assignment made
+    by another worker takes effect immediately; a removed assignment is
+    honoured by other workers once ``ttl_seconds`` have passed.
+    """
+
+    def __init__(self, ttl_seconds: int, max_users: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._users: Dict[str, Tuple[FrozenSet[str], float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _cached(self, user_id: str):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry and time.monotonic() - entry[1] <= self.ttl_seconds:
+                return entry[0]
+            return None
+
+    def _store(self, user_id: str, agent_ids: FrozenSet[str]):
+        if self.max_users <= 0:
+            return
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._users[user_id] = (agent_ids, time.monotonic())
+            while len(self._users) > self.max_users:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._users.pop(next(iter(self._users)))
+
+    async def is_assigned(self, user_id: str, agent_id: str) -> bool:
+        agent_ids = self._cached(user_id)
+        if agent_ids is not None and agent_id in agent_ids:
+            with self._lock:
+                self.hits += 1
+            return True
+
+        with self._lock:
+            self.misses += 1
+        agent_ids = await db.run(_load_assignments, user_id)
+        self._store(user_id, agent_ids)
+        return agent_id in agent_ids
+
+    def invalidate(self, agent_id: str, user_ids: Iterable[str] = ()):
+        """Forget ``user_ids`` and every user currently holding ``agent_id``."""
+        user_ids = set(user_ids)
+        with self._lock:
+            stale = [user for user, (agent_ids, _) in self._users.items() if user in user_ids or agent_id in agent_ids]
+            for user in stale:
+                del self._users[user]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+assignment_cache = AssignmentCache(ASSIGNMENT_CACHE_TTL_SECONDS, ASSIGNMENT_CACHE_MAX_USERS)
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+from app.core.config import (
+    CHAT_EXECUTOR_WORKERS, CHAT_EXECUTOR_MAX_QUEUE, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE,
+)
+
+
+class BoundedExecutor:
+    """Dedicated thread pool for one kind of blocking work.
+
+    Keeps the work off the event loop and off FastAPI's default threadpool,
+    and records queue depth and wait/run times for monitoring. Work
+    submitted while ``max_queue`` jobs are already waiting is rejected with
+    ``busy_status``; 0 leaves the queue unbounded.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int = 0, name: str = "bounded", busy_status: int = 503):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.busy_status = busy_status
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def _execute(self, fn: Callable[..., Any], submitted_at: float) -> Any:
+        started_at = time.perf_counter()
+        wait = started_at - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+        failed = False
+        try:
+            return fn()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._total_run += time.perf_counter() - started_at
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=self.busy_status,
+                    detail="Server is busy, please retry shortly.",
+                    headers={"Retry-After": "1"},
+                )
+            self._queued += 1
+
+        future = self._executor.submit(self._execute, partial(fn, *args, **kwargs), time.perf_counter())
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # Cancelled before a worker picked it up, so _execute never ran
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            started = finished + self._active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "avg_run_ms": round(self._total_run / finished * 1000, 2) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Blocking agent work: LLM calls, FAISS searches and embeddings
+inference_executor = BoundedExecutor(CHAT_EXECUTOR_WORKERS, CHAT_EXECUTOR_MAX_QUEUE, name="inference")
+
+# bcrypt releases the GIL, so a few threads of its own keep login storms away from
+# every other sync endpoint; when they are saturated clients are asked to back off
+password_executor = BoundedExecutor(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, name="password-hash", busy_status=429
+)
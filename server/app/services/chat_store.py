@@ -0,0 +1,91 @@
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.core.database import db
+from app.models.chat import ChatMessage
+
+DEFAULT_HISTORY_LIMIT = 200
+
+
+def _append(conn, agent_id: str, user_id: str, messages: List[ChatMessage]) -> int:
+    row = conn.execute(
+        "SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE agent_id = ? AND user_id = ?",
+        (agent_id, user_id),
+    ).fetchone()
+    last_seq = row[0]
+    now = datetime.now().isoformat(sep=" ")
+    conn.executemany(
+        '''
+        INSERT INTO chat_messages (agent_id, user_id, seq, role, content, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+        [(agent_id, user_id, last_seq + i, msg.role, msg.content, now)
+         for i, msg in enumerate(messages, start=1)],
+    )
+    return last_seq + len(messages)
+
+
+async def aappend_messages(agent_id: str, user_id: str, messages: List[ChatMessage]) -> int:
+    """Append only the new messages of a turn; returns the last sequence number."""
+    return await db.atransaction(_append, agent_id, user_id, messages)
+
+
+async def aget_messages(
+    agent_id: str,
+    user_id: str,
+    limit: int = DEFAULT_HISTORY_LIMIT,
+    before_seq: Optional[int] = None,
+) -> Tuple[List[dict], Optional[int]]:
+    """Return up to ``limit`` messages (oldest first) preceding ``before_seq``.
+
+    The second value is the cursor for the next older page, or None when the
+    start of the conversation has been reached.
+    """
+    params = [agent_id, user_id]
+    query = "SELECT seq, role, content FROM chat_messages WHERE agent_id = ? AND user_id = ?"
+    if before_seq is not None:
+        query += " AND seq < ?"
+        params.append(before_seq)
+    query += " ORDER BY seq DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = await db.afetchall(query, params)
+    has_more = len(rows) > limit
+    rows = list(reversed(rows[:limit]))
+
+    messages = [{"role": row["role"], "content": row["content"]} for row in rows]
+    next_before = rows[0]["seq"] if has_more and rows else None
+    return messages, next_before
+
+
+def migrate_legacy_history(cursor):
+    """Explode old ``chat_history`` JSON blobs into per-message rows."""
+    cursor.execute("SELECT id, agent_id, user_id, messages, updated_at FROM chat_history")
+    legacy_rows = cursor.fetchall()
+
+    for chat_id, agent_id, user_id, messages_json, updated_at in legacy_rows:
+        user_id = user_id or ""
+        try:
+            messages = json.loads(messages_json)
+        except (TypeError, ValueError):
+            messages = []
+
+        # Skip conversations that already have migrated rows
+        cursor.execute(
+            "SELECT 1 FROM chat_messages WHERE agent_id = ? AND user_id = ? LIMIT 1",
+            (agent_id, user_id),
+        )
+        if not cursor.fetchone():
+            cursor.executemany(
+                '''
+                INSERT INTO chat_messages (agent_id, user_id, seq, role, content, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''',
+                [(agent_id, user_id, seq, msg.get("role", ""), msg.get("content", ""), updated_at)
+                 for seq, msg in enumerate(messages, start=1)],
+            )
+        cursor.execute("DELETE FROM chat_history WHERE id = ?", (chat_id,))
+
+    if legacy_rows:
+        print(f"✅ Migrated {len(legacy_rows)} chat history blobs to chat_messages")
@@ -0,0 +1,135 @@
+import re
+import threading
+from typing import List, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.config import CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_RELEVANCE
+
+# The splitter repeats up to 200 chars between neighbouring chunks; allow some slack
+_MAX_OVERLAP_CHARS = 400
+_MIN_OVERLAP_CHARS = 20
+_MIN_CHUNK_CHARS = 20
+
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_PATTERN = re.compile(r"\w+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "many", "much", "of", "on", "or", "our", "the", "to", "we", "what", "when",
+    "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+_stats_lock = threading.Lock()
+packing_counters = {"turns": 0, "candidates": 0, "dropped": 0, "candidate_tokens": 0, "packed_tokens": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with OpenAI tokenizers
+    return len(text) // 4 + 1
+
+
+def relevance_from_distance(distance: float) -> float:
+    # FAISS returns squared L2; for unit-length embeddings cosine = 1 - d^2 / 2
+    return 1.0 - float(distance) / 2.0
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    longest = min(len(left), len(right), _MAX_OVERLAP_CHARS)
+    for size in range(longest, _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _strip_overlaps(text: str, kept: Sequence[str]) -> str:
+    for other in kept:
+        if text in other:
+            return ""
+        text = text[_overlap(other, text):]
+        tail = _overlap(text, other)
+        if tail:
+            text = text[:-tail]
+    return text
+
+
+def _terms(text: str) -> Set[str]:
+    return {word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOPWORDS}
+
+
+def _trim_sentences(text: str, question_terms: Set[str], max_tokens: int) -> str:
+    """Keep the sentences sharing most terms with the question, in their original order."""
+    sentences = [s.strip() for s in _SENTENCE_PATTERN.split(text) if s and s.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: -len(question_terms & _terms(sentences[i])))
+
+    chosen = []
+    used = 0
+    for i in ranked:
+        if not question_terms & _terms(sentences[i]):
+            break
+        cost = estimate_tokens(sentences[i])
+        if used + cost <= max_tokens:
+            chosen.append(i)
+            used += cost
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def pack_context(
+    question: str,
+    docs_and_distances: List[Tuple[Document, float]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    min_relevance: float = CONTEXT_MIN_RELEVANCE,
+) -> List[Document]:
+    """Select what goes into the prompt from retrieved chunks, within ``token_budget``.
+
+    Chunks below ``min_relevance`` are dropped, except the best one since
+    score ranges differ between embedding backends. Text repeated from a
+    more relevant chunk (the splitter's overlap) is removed, and a chunk that
+    no longer fits is cut down to its sentences most related to the question.
+    """
+    candidates = sorted(
+        ((doc, relevance_from_distance(distance)) for doc, distance in docs_and_distances),
+        key=lambda pair: -pair[1],
+    )
+    question_terms = _terms(question)
+
+    kept: List[str] = []
+    packed: List[Document] = []
+    used = 0
+    for rank, (doc, relevance) in enumerate(candidates):
+        if rank > 0 and relevance < min_relevance:
+            continue
+        text = _strip_overlaps(doc.page_content, kept).strip()
+        if len(text) < _MIN_CHUNK_CHARS:
+            continue
+        remaining = token_budget - used
+        if estimate_tokens(text) > remaining:
+            text = _trim_sentences(text, question_terms, remaining)
+            if not text:
+                continue
+        kept.append(doc.page_content)
+        packed.append(Document(page_content=text, metadata={**doc.metadata, "relevance": round(relevance, 4)}))
+        used += estimate_tokens(text)
+
+    with _stats_lock:
+        packing_counters["turns"] += 1
+        packing_counters["candidates"] += len(candidates)
+        packing_counters["dropped"] += len(candidates) - len(packed)
+        packing_counters["candidate_tokens"] += sum(estimate_tokens(doc.page_content) for doc, _ in candidates)
+        packing_counters["packed_tokens"] += used
+    return packed
+
+
+def get_packing_stats() -> dict:
+    with _stats_lock:
+        stats = dict(packing_counters)
+    turns = stats["turns"]
+    stats["avg_candidate_tokens"] = round(stats["candidate_tokens"] / turns, 1) if turns else 0.0
+    stats["avg_packed_tokens"] = round(stats["packed_tokens"] / turns, 1) if turns else 0.0
+    stats["token_budget"] = CONTEXT_TOKEN_BUDGET
+    stats["min_relevance"] = CONTEXT_MIN_RELEVANCE
+    return stats
+
+
+def join_context(docs: List[Document]) -> str:
+    return "\n\n".join(doc.page_content for doc in docs)
@@ -0,0 +1,94 @@
+import re
+import threading
+import zlib
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import EMBEDDING_BACKEND, EMBEDDING_API_BASE, EMBEDDING_HASH_DIM
+from app.core.database import db
+from app.services.embedding_cache import cached_embeddings
+from app.services.embedding_pipeline import rate_limited
+
+EMBEDDING_BACKENDS = ("openai", "hashing")
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """In-process embeddings from hashed word unigrams and bigrams.
+
+    Needs no model download or network: each token is hashed with CRC32 into
+    one of ``dim`` signed buckets, term counts are log-scaled and rows are
+    L2-normalised. Hashing is stable across processes, so indexes built by
+    one worker can be queried by another.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_HASH_DIM):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[int]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [zlib.crc32(term.encode("utf-8")) for term in terms]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        hashes = [self._features(text) for text in texts]
+        rows = np.repeat(np.arange(len(texts)), [len(h) for h in hashes])
+        flat = np.fromiter((h for row in hashes for h in row), dtype=np.uint32, count=len(rows))
+
+        # Low bits pick the bucket, the top bit the sign, so collisions tend to cancel out
+        columns = flat % self.dim
+        signs = np.where(flat >> 31, -1.0, 1.0).astype(np.float32)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (rows, columns), signs)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def _create_backend(name: str) -> Embeddings:
+    if name == "hashing":
+        # Cheaper to recompute than to look up in the on-disk cache
+        return HashingEmbeddings()
+    # Retries are handled by the rate-limited wrapper, not the client. OpenAI-compatible
+    # servers set through EMBEDDING_API_BASE get raw text instead of token ids.
+    backend = OpenAIEmbeddings(
+        base_url=EMBEDDING_API_BASE,
+        check_embedding_ctx_length=EMBEDDING_API_BASE is None,
+        max_retries=0,
+    )
+    return cached_embeddings(rate_limited(backend))
+
+
+_backends: Dict[str, Embeddings] = {}
+_backends_lock = threading.Lock()
+
+
+def get_embedding_backend(name: str = None) -> Embeddings:
+    """Shared embeddings for backend ``name``, or the deployment default (EMBEDDING_BACKEND)."""
+    name = name or EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = _create_backend(name)
+        return _backends[name]
+
+
+def get_agent_embeddings(agent_id: str) -> Embeddings:
+    """Embeddings the agent's index was built with; queries must use the same backend."""
+    row = db.fetchone("SELECT embedding_backend FROM agents WHERE id = ?", (agent_id,))
+    return get_embedding_backend(row["embedding_backend"] if row else None)
@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+from app.core.database import Database, PARAM_BATCH_SIZE
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed, on-disk cache in front of an embedding backend.
+
+    Document vectors are keyed by sha256(model + chunk text), so the same
+    chunk is embedded once no matter how many agents or uploads contain it.
+    Least recently used entries are evicted past ``max_entries``.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, store: Database, max_entries: int):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._init_store()
+
+    def _init_store(self):
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.store.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(keys), PARAM_BATCH_SIZE):
+            batch = keys[i:i + PARAM_BATCH_SIZE]
+            placeholders = ",".join("?" for _ in batch)
+            rows = self.store.fetchall(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _touch(self, keys: List[str]):
+        if keys:
+            now = time.time()
+            self.store.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in keys])
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        self.store.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()],
+        )
+        self._evict()
+
+    def _evict(self):
+        count = self.store.fetchone("SELECT COUNT(*) FROM embeddings")[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.store.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            with self._lock:
+                self.evictions += overflow
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing chunk once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        # Refresh hits before storing so eviction never drops what was just used
+        self._touch(list(cached))
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def stats(self) -> dict:
+        entries = self.store.fetchone("SELECT COUNT(*) FROM embeddings")[0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+embedding_store = Database(EMBEDDING_CACHE_PATH, pool_size=4)
+
+# One wrapper per embedding model so every PDFProcessor shares counters
+_cached_by_model: Dict[str, CachedEmbeddings] = {}
+_cached_lock = threading.Lock()
+
+
+def cached_embeddings(underlying: Embeddings) -> CachedEmbeddings:
+    model_name = getattr(underlying, "model", None) or type(underlying).__name__
+    with _cached_lock:
+        if model_name not in _cached_by_model:
+            _cached_by_model[model_name] = CachedEmbeddings(
+                underlying, model_name, embedding_store, EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _cached_by_model[model_name]
+
+
+def get_embedding_cache_stats() -> List[dict]:
+    with _cached_lock:
+        caches = list(_cached_by_model.values())
+    return [cache.stats() for cache in caches]
@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import (
+    EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_IN_FLIGHT, EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE, EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF_SECONDS,
+)
+
+_MAX_BACKOFF_SECONDS = 60.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``per_minute``; 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        if self.capacity <= 0:
+            return
+        # A single oversized request may take the whole bucket but never blocks forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        # After a 429 every caller sharing the bucket waits for it to refill
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = 0.0
+
+
+def _estimate_tokens(texts: List[str]) -> int:
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Wraps an embedding backend with shared rate limits and per-call retry.
+
+    Each call first takes its request and estimated token cost from the
+    buckets. Rate-limited, 5xx and connection failures are retried with
+    exponential backoff and jitter (or the server's Retry-After), so only
+    the failing batch is repeated.
+    """
+
+    def __init__(self, underlying: Embeddings, requests: TokenBucket, tokens: TokenBucket,
+                 max_retries: int, backoff_seconds: float):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", None) or type(underlying).__name__
+        self.requests = requests
+        self.tokens = tokens
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+
+    def _call(self, fn: Callable, texts: List[str]):
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire()
+            self.tokens.acquire(_estimate_tokens(texts))
+            with self._lock:
+                self.calls += 1
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                if getattr(e, "status_code", None) == 429 or isinstance(e, openai.RateLimitError):
+                    self.requests.drain()
+                delay = _retry_after(e) or min(_MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** attempt)
+                with self._lock:
+                    self.retries += 1
+                print(f"❌ Embedding call failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay * random.uniform(1.0, 1.25))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(lambda: self.underlying.embed_documents(texts), texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(lambda: self.underlying.embed_query(text), [text])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"model": self.model, "calls": self.calls, "retries": self.retries}
+
+
+# Limits apply per API key, so every wrapper in the process shares them
+_request_bucket = TokenBucket(EMBEDDING_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(EMBEDDING_TOKENS_PER_MINUTE)
+
+
+def rate_limited(underlying: Embeddings) -> RateLimitedEmbeddings:
+    return RateLimitedEmbeddings(
+        underlying, _request_bucket, _token_bucket, EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF_SECONDS
+    )
+
+
+def embed_in_batches(
+    embeddings: Embeddings,
+    texts: List[str],
+    on_progress: Optional[Callable[[int], None]] = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+) -> List[List[float]]:
+    """Embed ``texts`` in fixed-size batches with up to ``max_in_flight`` calls at once.
+
+    Vectors come back in input order. ``on_progress`` receives the number of
+    texts embedded so far as batches complete, in any order.
+    """
+    if not texts:
+        return []
+
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    results: List[Optional[List[List[float]]]] = [None] * len(batches)
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(batches)))) as pool:
+        futures = {pool.submit(embeddings.embed_documents, batch): i for i, batch in enumerate(batches)}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                done += len(batches[i])
+                if on_progress:
+                    on_progress(done)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return [vector for batch in results for vector in batch]
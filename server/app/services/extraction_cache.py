@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from app.core.config import EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_PAGES
+from app.core.database import Database, PARAM_BATCH_SIZE
+
+
+class ExtractionCache:
+    """On-disk cache of extracted page text keyed by page content hash.
+
+    A hit returns the page's text and OCR flag, so pdfplumber and tesseract
+    are skipped for every page seen before by any agent, including unchanged
+    pages of an edited document.
+    """
+
+    def __init__(self, store: Database, max_pages: int):
+        self.store = store
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_store()
+
+    def _init_store(self):
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS page_texts (
+                page_hash TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                ocr INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.store.execute('CREATE INDEX IF NOT EXISTS idx_page_texts_last_used ON page_texts (last_used)')
+
+    def get_pages(self, page_hashes: List[str]) -> Dict[str, Tuple[str, bool]]:
+        """Cached (text, ocr) for each of ``page_hashes`` that has been extracted before."""
+        unique = list(dict.fromkeys(page_hashes))
+        found = {}
+        for start in range(0, len(unique), PARAM_BATCH_SIZE):
+            batch = unique[start:start + PARAM_BATCH_SIZE]
+            placeholders = ",".join("?" for _ in batch)
+            rows = self.store.fetchall(
+                f"SELECT page_hash, text, ocr FROM page_texts WHERE page_hash IN ({placeholders})", batch
+            )
+            found.update((row["page_hash"], (row["text"], bool(row["ocr"]))) for row in rows)
+
+        if found:
+            now = time.time()
+            self.store.executemany(
+                "UPDATE page_texts SET last_used = ? WHERE page_hash = ?", [(now, page_hash) for page_hash in found]
+            )
+        with self._lock:
+            hits = sum(1 for page_hash in page_hashes if page_hash in found)
+            self.hits += hits
+            self.misses += len(page_hashes) - hits
+        return found
+
+    def put_pages(self, pages: Dict[str, Tuple[str, bool]]):
+        if not pages:
+            return
+
+        def write(conn):
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO page_texts (page_hash, text, ocr, last_used) VALUES (?, ?, ?, ?)",
+                [(page_hash, text, int(ocr), now) for page_hash, (text, ocr) in pages.items()],
+            )
+            # Evict least recently used pages past the cap
+            conn.execute('''
+                DELETE FROM page_texts WHERE page_hash IN (
+                    SELECT page_hash FROM page_texts ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_pages,))
+
+        self.store.run_in_transaction(write)
+
+    def stats(self) -> dict:
+        pages = self.store.fetchone("SELECT COUNT(*) FROM page_texts")[0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "pages": pages,
+                "max_pages": self.max_pages,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+extraction_cache = ExtractionCache(Database(EXTRACTION_CACHE_PATH, pool_size=4), EXTRACTION_CACHE_MAX_PAGES)
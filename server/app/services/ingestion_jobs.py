@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import uuid
+from typing import List, Optional
+
+from app.core.config import INGESTION_WORKERS, INGESTION_POLL_SECONDS, INGESTION_LEASE_SECONDS
+from app.core.database import db
+from app.services.pdf_processor import PDFProcessor
+from app.services.embedding_backends import get_embedding_backend, get_agent_embeddings
+from app.services.prompt_generator import SystemPromptGenerator
+from app.services.rag_engine import invalidate_agent
+from app.services.assignment_cache import assignment_cache
+from app.services.upload_storage import SpooledUpload
+from app.services.vector_index import (
+    append_segment, agent_index_dir, compact_agent_index, delete_agent_index, get_agent_index_type,
+)
+
+pdf_processor = PDFProcessor()
+prompt_generator = SystemPromptGenerator()
+
+# Wakes idle workers in this process as soon as a job is enqueued
+_job_available = asyncio.Event()
+
+
+class LeaseLostError(RuntimeError):
+    """The job's lease lapsed and another worker may have taken it over."""
+
+
+JOB_COLUMNS = '''
+    id, kind, agent_id, user_id, status, files_total, files_done, pages_done,
+    chunks_total, embeddings_done, error, created_at, updated_at, finished_at
+'''
+
+
+def enqueue_job(kind: str, agent_id: str, user_id: str, uploads: List[SpooledUpload], payload: Optional[dict] = None) -> str:
+    job_id = str(uuid.uuid4())
+    files = [{"filename": u.filename, "path": u.path, "content_hash": u.content_hash} for u in uploads]
+    db.execute(
+        '''
+        INSERT INTO ingestion_jobs (id, kind, agent_id, user_id, status, files, payload, files_total)
+        VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)
+        ''',
+        (job_id, kind, agent_id, user_id, json.dumps(files), json.dumps(payload or {}), len(files)),
+    )
+    return job_id
+
+
+async def aenqueue_job(kind: str, agent_id: str, user_id: str, uploads: List[SpooledUpload], payload: Optional[dict] = None) -> str:
+    job_id = await db.run(enqueue_job, kind, agent_id, user_id, uploads, payload)
+    _job_available.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    row = db.fetchone(f"SELECT {JOB_COLUMNS} FROM ingestion_jobs WHERE id = ?", (job_id,))
+    return dict(row) if row else None
+
+
+def list_jobs(agent_id: Optional[str] = None, user_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+    where = []
+    params = []
+    if agent_id:
+        where.append("agent_id = ?")
+        params.append(agent_id)
+    if user_id:
+        where.append("user_id = ?")
+        params.append(user_id)
+    query = f"SELECT {JOB_COLUMNS} FROM ingestion_jobs"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    return [dict(row) for row in db.fetchall(query, params)]
+
+
+def _lease_expiry() -> str:
+    return f"+{INGESTION_LEASE_SECONDS} seconds"
+
+
+def _claim_next_job(worker_id: str) -> Optional[dict]:
+    """Take the oldest queued job, or a running one whose worker stopped renewing its lease."""
+    def claim(conn):
+        row = conn.execute(
+            '''
+            SELECT * FROM ingestion_jobs
+            WHERE status = 'queued'
+               OR (status = 'running'
+                   AND COALESCE(lease_expires_at, datetime(updated_at, ?)) < CURRENT_TIMESTAMP)
+            ORDER BY created_at LIMIT 1
+            ''',
+            (_lease_expiry(),),
+        ).fetchone()
+        if not row:
+            return None
+        if row["status"] == "running":
+            print(f"⚠️ Reclaiming ingestion job {row['id']} from {row['worker_id']}, whose lease expired")
+        conn.execute(
+            '''
+            UPDATE ingestion_jobs
+            SET status = 'running', worker_id = ?, lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''',
+            (worker_id, _lease_expiry(), row["id"]),
+        )
+        return {**dict(row), "worker_id": worker_id}
+
+    return db.run_in_transaction(claim)
+
+
+def _renew_lease(conn, job: dict, fields: Optional[dict] = None):
+    # Every write by the worker goes through here, so it also proves the job is still ours
+    fields = fields or {}
+    assignments = "".join(f"{name} = ?, " for name in fields)
+    updated = conn.execute(
+        f'''
+        UPDATE ingestion_jobs
+        SET {assignments}lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND worker_id = ? AND status = 'running'
+        ''',
+        (*fields.values(), _lease_expiry(), job["id"], job["worker_id"]),
+    ).rowcount
+    if not updated:
+        raise LeaseLostError(f"Ingestion job {job['id']} is no longer held by {job['worker_id']}")
+
+
+def _update_progress(job: dict, **fields):
+    db.run_in_transaction(_renew_lease, job, fields)
+
+
+def _finish_job(job: dict, status: str, error: Optional[str] = None):
+    db.execute(
+        '''
+        UPDATE ingestion_jobs
+        SET status = ?, error = ?, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND worker_id = ?
+        ''',
+        (status, error, job["id"], job["worker_id"]),
+    )
+
+
+async def _heartbeat(job: dict):
+    # Long extractions and embedding batches can go quiet for longer than the lease
+    while True:
+        await asyncio.sleep(INGESTION_LEASE_SECONDS / 3)
+        try:
+            await db.run(_update_progress, job)
+        except LeaseLostError:
+            return
+        except Exception as e:
+            print("❌ ERROR renewing ingestion job lease:", job["id"], str(e))
+
+
+def insert_agent(conn, agent_id: str, payload: dict, system_prompt: str, vector_index_path: Optional[str]):
+    conn.execute('''
+        INSERT INTO agents (id, name, description, tools, system_prompt, vector_index_path, embedding_backend, index_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (agent_id, payload["name"], payload["description"], json.dumps(payload["tools"]),
+          system_prompt, vector_index_path, payload["embedding_backend"], payload["index_type"]))
+    conn.executemany(
+        'INSERT INTO agent_assignments (id, agent_id, user_id) VALUES (?, ?, ?)',
+        [(str(uuid.uuid4()), agent_id, user_id) for user_id in payload["assigned_user_ids"]]
+    )
+
+
+def _reindex(job: dict):
+    # Rebuild the whole index (base and segments) as one base of the agent's current type
+    _update_progress(job)
+    compact_agent_index(job["agent_id"], get_agent_embeddings(job["agent_id"]), force=True)
+
+
+def process_job(job: dict):
+    if job["kind"] == "reindex":
+        _reindex(job)
+        return
+
+    agent_id = job["agent_id"]
+    files = json.loads(job["files"])
+    payload = json.loads(job["payload"] or "{}")
+
+    documents = []
+    pages_done = 0
+    for files_done, file in enumerate(files, start=1):
+        document = pdf_processor.extract_pdf(file["path"], file["content_hash"])
+        documents.append(document)
+        pages_done += len(document.pages)
+        _update_progress(job, files_done=files_done, pages_done=pages_done)
+
+    chunks = []
+    for document in documents:
+        chunks.extend(pdf_processor.text_splitter.split_text(document.text))
+    _update_progress(job, chunks_total=len(chunks))
+
+    if job["kind"] == "upload" and not chunks:
+        raise ValueError("No valid text found in PDFs.")
+
+    if job["kind"] == "create_agent":
+        embeddings = get_embedding_backend(payload["embedding_backend"])
+        index_type = payload["index_type"]
+    else:
+        embeddings = get_agent_embeddings(agent_id)
+        index_type = get_agent_index_type(agent_id)
+
+    if job["kind"] == "create_agent":
+        knowledge_summary = "".join(document.text[:1000] + "..." for document in documents)
+        system_prompt = prompt_generator.generate_system_prompt(payload["name"], payload["description"], knowledge_summary)
+
+    def register(conn, vector_index_path: Optional[str]):
+        # Runs in the transaction that registers the segment, so a job that lost
+        # its lease or whose agent was deleted meanwhile leaves no segment behind
+        _renew_lease(conn, job)
+        if job["kind"] == "create_agent":
+            # The agent only becomes visible once its knowledge base is ready
+            insert_agent(conn, agent_id, payload, system_prompt, vector_index_path)
+        elif not conn.execute(
+            "UPDATE agents SET vector_index_path = ?, version = version + 1 WHERE id = ?",
+            (vector_index_path, agent_id),
+        ).rowcount:
+            raise ValueError("Agent was deleted during ingestion.")
+
+    if chunks:
+        append_segment(
+            agent_id, chunks, embeddings,
+            on_progress=lambda done: _update_progress(job, embeddings_done=done),
+            index_type=index_type,
+            on_register=lambda conn: register(conn, agent_index_dir(agent_id)),
+        )
+    else:
+        db.run_in_transaction(register, None)
+
+    if job["kind"] == "create_agent":
+        assignment_cache.invalidate(agent_id, payload["assigned_user_ids"])
+
+
+def _discard_failed_job(job: dict):
+    agent_dir = agent_index_dir(job["agent_id"])
+    if job["kind"] == "create_agent":
+        # A failed creation must not leave an index behind for an agent that never existed
+        db.run_in_transaction(delete_agent_index, job["agent_id"])
+        shutil.rmtree(agent_dir, ignore_errors=True)
+    elif not db.fetchone("SELECT 1 FROM agents WHERE id = ?", (job["agent_id"],)):
+        # The agent was deleted mid-job; its segment is already gone, but the
+        # directory may have been recreated after the sweep removed it
+        try:
+            os.rmdir(agent_dir)
+        except OSError:
+            pass
+
+
+def _remove_job_files(job: dict):
+    for file in json.loads(job["files"]):
+        if os.path.exists(file["path"]):
+            os.remove(file["path"])
+
+
+async def _worker_loop(worker_number: int):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_number}-{uuid.uuid4().hex[:8]}"
+    while True:
+        try:
+            job = await db.run(_claim_next_job, worker_id)
+        except Exception as e:
+            print("❌ ERROR claiming ingestion job:", str(e))
+            job = None
+
+        if not job:
+            _job_available.clear()
+            try:
+                await asyncio.wait_for(_job_available.wait(), timeout=INGESTION_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        print(f"✅ Ingestion worker {worker_number} started job {job['id']} ({job['kind']})")
+        heartbeat = asyncio.create_task(_heartbeat(job))
+        try:
+            await asyncio.to_thread(process_job, job)
+            await db.run(_finish_job, job, "completed")
+            # The index changed, so sessions in this process must reload it
+            invalidate_agent(job["agent_id"])
+        except LeaseLostError as e:
+            # The new holder owns the job, its files and any cleanup now
+            print("❌ ERROR in ingestion job:", job["id"], str(e))
+            continue
+        except Exception as e:
+            print("❌ ERROR in ingestion job:", job["id"], str(e))
+            await asyncio.to_thread(_discard_failed_job, job)
+            await db.run(_finish_job, job, "failed", str(e))
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(_remove_job_files, job)
+
+
+async def run_ingestion_workers():
+    await asyncio.gather(*[_worker_loop(n) for n in range(1, INGESTION_WORKERS + 1)])
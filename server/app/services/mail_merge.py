@@ -0,0 +1,50 @@
+import asyncio
+import math
+import string
+from typing import Any, Dict, List, Set
+
+from app.core.config import MAIL_MERGE_WORKERS
+from app.workers import SpawnPool
+from app.workers.letters import LETTER_RENDERERS, RenderResult, render_batch
+
+# python-docx is pure Python, so letters are rendered in separate processes
+merge_pool = SpawnPool(MAIL_MERGE_WORKERS)
+
+
+def template_fields(template: str) -> Set[str]:
+    """Names of the {fields} in a subject or body template.
+
+    Only plain named fields are allowed: positional fields, attribute and
+    index access would let recipient data reach into Python objects.
+    Raises ValueError for those and for malformed braces.
+    """
+    fields = set()
+    for _, field_name, format_spec, _ in string.Formatter().parse(template):
+        if field_name is None:
+            continue
+        if not field_name.isidentifier():
+            raise ValueError(f"Unsupported placeholder {{{field_name}}}; use plain names like {{fullName}}")
+        fields.add(field_name)
+        if format_spec:
+            # Format specs may contain nested fields, e.g. {salary:>{width}}
+            fields |= template_fields(format_spec)
+    return fields
+
+
+async def render_letters(template_type: str, field_sets: List[Dict[str, Any]]) -> List[RenderResult]:
+    """Render one letter per field set across the merge pool, in input order.
+
+    Field sets are split into one contiguous slice per worker, so a request
+    costs a round trip per worker rather than per letter. A letter that
+    fails to render is reported in its slot without affecting the others.
+    """
+    if not field_sets:
+        return []
+    size = math.ceil(len(field_sets) / MAIL_MERGE_WORKERS)
+    loop = asyncio.get_running_loop()
+    pool = merge_pool.get()
+    batches = await asyncio.gather(*[
+        loop.run_in_executor(pool, render_batch, template_type, field_sets[start:start + size])
+        for start in range(0, len(field_sets), size)
+    ])
+    return [result for batch in batches for result in batch]
@@ -0,0 +1,283 @@
+import asyncio
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import aiosmtplib
+from fastapi import HTTPException
+
+from app.core.config import (
+    APP_EMAIL, APP_PASSWORD, SMTP_HOST, SMTP_PORT, SMTP_USE_TLS, SMTP_TIMEOUT_SECONDS,
+    MAIL_CONNECTIONS, MAIL_MAX_ATTEMPTS, MAIL_BACKOFF_SECONDS, MAIL_POLL_SECONDS,
+    MAIL_IDLE_SECONDS, MAIL_STALE_SECONDS, MAIL_MAX_MESSAGE_BYTES, MAIL_RETENTION_DAYS, MAIL_SWEEP_SECONDS,
+)
+from app.core.database import db
+from app.services.email_sender import build_email
+
+# Wakes idle senders in this process as soon as a message is enqueued
+_mail_available = asyncio.Event()
+
+# (to, subject, body, [(filename, content), ...])
+OutboundEmail = Tuple[str, str, str, List[Tuple[str, bytes]]]
+
+# (message id, None) when queued, (None, error) otherwise
+EnqueueResult = Tuple[Optional[str], Optional[str]]
+
+EMAIL_COLUMNS = '''
+    id, user_id, batch_id, recipient, subject, status, attempts, error,
+    next_attempt_at, created_at, updated_at, sent_at
+'''
+
+
+def enqueue_emails(user_id: Optional[str], emails: List[OutboundEmail],
+                   batch_id: Optional[str] = None) -> List[EnqueueResult]:
+    """Queue ``emails`` with a single statement; returns one result per email, in order.
+
+    A message over MAIL_MAX_MESSAGE_BYTES is left out with an error in its
+    slot; the others are still queued.
+    """
+    if not APP_EMAIL:
+        raise HTTPException(status_code=500, detail="Email credentials missing")
+
+    rows = []
+    results = []
+    for to, subject, body, attachments in emails:
+        message_id = str(uuid.uuid4())
+        message = build_email(message_id, APP_EMAIL, to, subject, body, attachments)
+        if len(message) > MAIL_MAX_MESSAGE_BYTES:
+            results.append((None, f"Email to {to} is {len(message)} bytes, over the {MAIL_MAX_MESSAGE_BYTES} byte limit"))
+            continue
+        rows.append((message_id, user_id, APP_EMAIL, to, subject, message, batch_id))
+        results.append((message_id, None))
+    if rows:
+        db.executemany(
+            '''
+            INSERT INTO outbound_emails (id, user_id, sender, recipient, subject, message, status, batch_id)
+            VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)
+            ''',
+            rows,
+        )
+    return results
+
+
+def _single(result: EnqueueResult) -> str:
+    message_id, error = result
+    if error:
+        raise HTTPException(status_code=413, detail=error)
+    return message_id
+
+
+def enqueue_email(user_id: Optional[str], to: str, subject: str, body: str,
+                  attachments: List[Tuple[str, bytes]]) -> str:
+    """Queue one email; raises 413 if it exceeds MAIL_MAX_MESSAGE_BYTES."""
+    return _single(enqueue_emails(user_id, [(to, subject, body, attachments)])[0])
+
+
+async def aenqueue_emails(user_id: Optional[str], emails: List[OutboundEmail],
+                          batch_id: Optional[str] = None) -> List[EnqueueResult]:
+    results = await db.run(enqueue_emails, user_id, emails, batch_id)
+    if any(message_id for message_id, _ in results):
+        _mail_available.set()
+    return results
+
+
+async def aenqueue_email(user_id: Optional[str], to: str, subject: str, body: str,
+                         attachments: List[Tuple[str, bytes]]) -> str:
+    return _single((await aenqueue_emails(user_id, [(to, subject, body, attachments)]))[0])
+
+
+def get_email(message_id: str) -> Optional[dict]:
+    row = db.fetchone(f"SELECT {EMAIL_COLUMNS} FROM outbound_emails WHERE id = ?", (message_id,))
+    return dict(row) if row else None
+
+
+def list_batch_emails(batch_id: str) -> List[dict]:
+    rows = db.fetchall(f"SELECT {EMAIL_COLUMNS} FROM outbound_emails WHERE batch_id = ? ORDER BY rowid", (batch_id,))
+    return [dict(row) for row in rows]
+
+
+def _claim_next_email() -> Optional[dict]:
+    def claim(conn):
+        row = conn.execute(
+            '''
+            SELECT id, sender, recipient, message, attempts FROM outbound_emails
+            WHERE status = 'queued' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at LIMIT 1
+            '''
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            '''
+            UPDATE outbound_emails SET status = 'sending', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''',
+            (row["id"],),
+        )
+        return {**dict(row), "attempts": row["attempts"] + 1}
+
+    return db.run_in_transaction(claim)
+
+
+def _mark_sent(message_id: str):
+    # The body is never read again once delivered, so it is dropped straight away
+    db.execute(
+        '''
+        UPDATE outbound_emails
+        SET status = 'sent', message = X'', error = NULL, updated_at = CURRENT_TIMESTAMP, sent_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''',
+        (message_id,),
+    )
+
+
+def _mark_failed(message_id: str, attempts: int, error: str, permanent: bool):
+    if permanent or attempts >= MAIL_MAX_ATTEMPTS:
+        db.execute(
+            "UPDATE outbound_emails SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (error, message_id),
+        )
+        return
+    delay = MAIL_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    db.execute(
+        '''
+        UPDATE outbound_emails
+        SET status = 'queued', error = ?, next_attempt_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''',
+        (error, f"+{delay} seconds", message_id),
+    )
+
+
+def requeue_stale_emails() -> int:
+    """Put messages whose sender died mid-delivery (after MAIL_STALE_SECONDS) back in the queue."""
+    return db.execute(
+        '''
+        UPDATE outbound_emails SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'sending' AND updated_at < datetime('now', ?)
+        ''',
+        (f"-{MAIL_STALE_SECONDS} seconds",),
+    )
+
+
+def purge_finished_emails() -> int:
+    """Delete sent and failed messages whose last attempt is older than MAIL_RETENTION_DAYS."""
+    return db.execute(
+        '''
+        DELETE FROM outbound_emails
+        WHERE status IN ('sent', 'failed') AND updated_at < datetime('now', ?)
+        ''',
+        (f"-{MAIL_RETENTION_DAYS} days",),
+    )
+
+
+def _is_permanent(error: Exception) -> bool:
+    # 5xx replies about the message or recipient will not change on retry; bad
+    # credentials might once the configuration is fixed. 4xx replies, including
+    # a refused recipient (greylisting, mailbox busy), are worth retrying.
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(refused.code >= 500 for refused in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+class MailConnection:
+    """One authenticated SMTP session reused across messages.
+
+    Reconnects when the server has dropped the session and closes it after
+    MAIL_IDLE_SECONDS without traffic, so the server does not have to.
+    """
+
+    def __init__(self):
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            use_tls=SMTP_USE_TLS,
+            timeout=SMTP_TIMEOUT_SECONDS,
+        )
+        await smtp.connect()
+        if APP_PASSWORD:
+            await smtp.login(APP_EMAIL, APP_PASSWORD)
+        return smtp
+
+    async def send(self, sender: str, recipient: str, message: bytes):
+        reused = self._smtp is not None and self._smtp.is_connected
+        if not reused:
+            await self.close()
+            self._smtp = await self._connect()
+        try:
+            await self._smtp.sendmail(sender, [recipient], message)
+        except aiosmtplib.SMTPServerDisconnected:
+            await self.close()
+            if not reused:
+                raise
+            # The server timed out a session we kept open; one fresh connection is not a retry
+            self._smtp = await self._connect()
+            await self._smtp.sendmail(sender, [recipient], message)
+        self._last_used = time.monotonic()
+
+    async def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > MAIL_IDLE_SECONDS:
+            await self.close()
+
+    async def close(self):
+        if self._smtp is None:
+            return
+        smtp, self._smtp = self._smtp, None
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+async def _sender_loop(sender_number: int):
+    connection = MailConnection()
+    try:
+        while True:
+            try:
+                email = await db.run(_claim_next_email)
+            except Exception as e:
+                print("❌ ERROR claiming outbound email:", str(e))
+                email = None
+
+            if not email:
+                await connection.close_if_idle()
+                _mail_available.clear()
+                try:
+                    await asyncio.wait_for(_mail_available.wait(), timeout=MAIL_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await connection.send(email["sender"], email["recipient"], email["message"])
+                await db.run(_mark_sent, email["id"])
+            except Exception as e:
+                print(f"❌ ERROR sending email {email['id']} (attempt {email['attempts']}):", str(e))
+                permanent = _is_permanent(e)
+                if not permanent:
+                    # A rejected recipient leaves the session usable; anything else starts afresh
+                    await connection.close()
+                await db.run(_mark_failed, email["id"], email["attempts"], str(e), permanent)
+    finally:
+        await connection.close()
+
+
+async def _sweep_loop():
+    while True:
+        try:
+            await db.run(requeue_stale_emails)
+            await db.run(purge_finished_emails)
+        except Exception as e:
+            print("❌ ERROR sweeping outbound emails:", str(e))
+        await asyncio.sleep(MAIL_SWEEP_SECONDS)
+
+
+async def run_mail_senders():
+    await asyncio.gather(_sweep_loop(), *[_sender_loop(n) for n in range(1, MAIL_CONNECTIONS + 1)])
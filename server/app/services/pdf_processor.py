@@ -1,56 +1,106 @@
-from typing import List
-from io import BytesIO
+from typing import List, Optional, Tuple
+from dataclasses import dataclass
+import hashlib
+import math
 import os
 import PyPDF2
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from app.core.config import PDF_EXTRACT_WORKERS, PDF_OCR_CONCURRENCY, PDF_PARALLEL_MIN_PAGES
+from app.services.embedding_backends import get_embedding_backend
+from app.services.vector_index import append_segment
+from app.services.extraction_cache import extraction_cache
+from app.workers import SpawnPool
+from app.workers.pdf_pages import init_page_worker, page_hash, extract_page_text, extract_pages
 
 import pdfplumber
-import pytesseract
+
+page_pool = SpawnPool(
+    PDF_EXTRACT_WORKERS,
+    initializer=init_page_worker,
+    initargs=lambda context: (context.Semaphore(PDF_OCR_CONCURRENCY),),
+)
+
+@dataclass
+class ExtractedPage:
+    number: int
+    text: str
+    ocr: bool
+
+@dataclass
+class ExtractedDocument:
+    content_hash: str
+    pages: List[ExtractedPage]
+
+    @property
+    def text(self) -> str:
+        return "".join(page.text + "\n" for page in self.pages)
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class PDFProcessor:
-    def __init__(self):
+    def __init__(self, embedding_backend: Optional[str] = None):
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
-        self.embeddings = OpenAIEmbeddings()
-    
-    def extract_text_from_pdf(self, pdf_content: bytes) -> str:
-        text = ""
-
-        with pdfplumber.open(BytesIO(pdf_content)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                # If no text found, try OCR on that specific page
-                if not page_text or len(page_text.strip()) < 30:
-                    print("[OCR Fallback for this page]")
-                    page_image = page.to_image(resolution=300)
-                    image = page_image.original
-                    ocr_text = pytesseract.image_to_string(image)
-                    text += ocr_text + "\n"
-                else:
-                    text += page_text + "\n"
-
-        return text
-    
-    def process_and_store_pdfs(self, pdf_files: List[bytes], agent_id: str) -> str:
+        # Defaults to the deployment-wide backend (EMBEDDING_BACKEND)
+        self.embeddings = get_embedding_backend(embedding_backend)
+
+    def extract_pdf(self, pdf_path: str, content_hash: Optional[str] = None) -> ExtractedDocument:
+        """Extract every page once; pages seen before, in any document, come from the extraction cache."""
+        content_hash = content_hash or _hash_file(pdf_path)
+        # Pages are read from disk on demand, the whole file is never loaded
+        with pdfplumber.open(pdf_path) as pdf:
+            hashes = [page_hash(page) for page in pdf.pages]
+            pages = extraction_cache.get_pages(hashes)
+            missing = [number for number, h in enumerate(hashes) if h not in pages]
+            serial = PDF_EXTRACT_WORKERS <= 1 or len(missing) < PDF_PARALLEL_MIN_PAGES
+            if serial:
+                extracted = [extract_page_text(pdf.pages[number]) for number in missing]
+        if not serial:
+            extracted = self._extract_pages(pdf_path, missing)
+
+        new_pages = {hashes[number]: page for number, page in zip(missing, extracted)}
+        extraction_cache.put_pages(new_pages)
+        pages.update(new_pages)
+
+        return ExtractedDocument(
+            content_hash=content_hash,
+            pages=[ExtractedPage(number, *pages[h]) for number, h in enumerate(hashes)],
+        )
+
+    def _extract_pages(self, pdf_path: str, numbers: List[int]) -> List[Tuple[str, bool]]:
+        # Split the pages into contiguous runs, one per worker, and keep page order
+        run_size = math.ceil(len(numbers) / PDF_EXTRACT_WORKERS)
+        pool = page_pool.get()
+        futures = [
+            pool.submit(extract_pages, pdf_path, numbers[start:start + run_size])
+            for start in range(0, len(numbers), run_size)
+        ]
+
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        return self.extract_pdf(pdf_path).text
+
+    def process_and_store_pdfs(self, documents: List[ExtractedDocument], agent_id: str) -> str:
         all_texts = []
-        
-        for pdf_content in pdf_files:
-            text = self.extract_text_from_pdf(pdf_content)
-            chunks = self.text_splitter.split_text(text)
+
+        for document in documents:
+            chunks = self.text_splitter.split_text(document.text)
             all_texts.extend(chunks)
-        
+
         if all_texts:
-            # Create FAISS index
-            vectorstore = FAISS.from_texts(all_texts, self.embeddings)
-            
-            # Save the index
-            index_path = f"data/vectors/{agent_id}"
-            vectorstore.save_local(index_path)
-            
-            return index_path
-        
+            # Store the chunks as a new segment of the agent's index
+            return append_segment(agent_id, all_texts, self.embeddings)
+
         return None
@@ -1,32 +1,133 @@
+import asyncio
+import threading
+from collections import OrderedDict
 from typing import Dict, Tuple
-from app.services.agent_runner import ReActAgent
+from app.services.agent_runner import ReActAgent, AgentRuntime
+from app.services.answer_cache import answer_cache
+from app.core.config import (
+    AGENT_POOL_MAX_ENTRIES,
+    AGENT_POOL_MAX_BYTES,
+    AGENT_POOL_IDLE_MINUTES,
+    AGENT_POOL_SWEEP_SECONDS,
+)
 from datetime import datetime, timedelta
 
-# Dictionary to hold agents keyed by (agent_id, user_id)
-agent_pool: Dict[Tuple[str, str], Tuple[ReActAgent, datetime]] = {}
+# Per-user agent sessions keyed by (agent_id, user_id), least recently used first
+agent_pool: "OrderedDict[Tuple[str, str], Tuple[ReActAgent, datetime]]" = OrderedDict()
+
+# One shared retrieval runtime per agent_id, reference counted by sessions
+runtime_registry: Dict[str, AgentRuntime] = {}
+_runtime_lock = threading.Lock()
 
 # Timeout duration for inactive agents (e.g., 30 minutes)
-INACTIVITY_TIMEOUT = timedelta(minutes=30)
+INACTIVITY_TIMEOUT = timedelta(minutes=AGENT_POOL_IDLE_MINUTES)
+
+pool_counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "stale_reloads": 0}
+
+# Last agents.version this process has seen per agent
+agent_versions: Dict[str, int] = {}
+
+def acquire_runtime(agent_id: str) -> AgentRuntime:
+    with _runtime_lock:
+        runtime = runtime_registry.get(agent_id)
+        if runtime is None:
+            runtime = AgentRuntime(agent_id)
+            runtime_registry[agent_id] = runtime
+        runtime.ref_count += 1
+        return runtime
+
+def release_runtime(runtime: AgentRuntime):
+    with _runtime_lock:
+        runtime.ref_count -= 1
+        if runtime.ref_count <= 0 and runtime_registry.get(runtime.agent_id) is runtime:
+            del runtime_registry[runtime.agent_id]
+
+def check_agent_version(agent_id: str, version: int):
+    """Drop what this process holds for the agent if it changed anywhere since we last looked."""
+    seen = agent_versions.get(agent_id)
+    if seen is not None and version > seen:
+        invalidate_agent(agent_id)
+        pool_counters["stale_reloads"] += 1
+    if seen is None or version > seen:
+        agent_versions[agent_id] = version
+
+def get_or_create_agent(agent_id: str, user_id: str, version: int = None) -> ReActAgent:
+    if version is not None:
+        check_agent_version(agent_id, version)
 
-def get_or_create_agent(agent_id: str, user_id: str) -> ReActAgent:
     key = (agent_id, user_id)
     now = datetime.utcnow()
 
     if key in agent_pool:
         agent, last_active = agent_pool[key]
-        # Update last active timestamp
+        # Update last active timestamp and LRU position
         agent_pool[key] = (agent, now)
+        agent_pool.move_to_end(key)
+        pool_counters["hits"] += 1
         return agent
 
-    # Create new agent instance and store with timestamp
-    agent = ReActAgent(agent_id)
+    # Create new session on top of the agent's shared runtime
+    pool_counters["misses"] += 1
+    agent = ReActAgent(agent_id, acquire_runtime(agent_id))
     agent_pool[key] = (agent, now)
+    enforce_pool_limits()
     return agent
 
+def remove_agent(key: Tuple[str, str]):
+    entry = agent_pool.pop(key, None)
+    if entry:
+        release_runtime(entry[0].runtime)
+
+def invalidate_agent(agent_id: str):
+    """Drop every session, the shared runtime and cached answers of an agent so the next chat reloads it."""
+    for key in [key for key in agent_pool if key[0] == agent_id]:
+        remove_agent(key)
+    with _runtime_lock:
+        runtime_registry.pop(agent_id, None)
+    answer_cache.invalidate(agent_id)
+
+def estimate_pool_bytes() -> int:
+    session_bytes = sum(agent.estimate_bytes() for agent, _ in list(agent_pool.values()))
+    with _runtime_lock:
+        runtime_bytes = sum(runtime.estimated_bytes for runtime in runtime_registry.values())
+    return session_bytes + runtime_bytes
+
+def enforce_pool_limits():
+    # Evict least recently used sessions until both the entry and byte budgets hold
+    while len(agent_pool) > AGENT_POOL_MAX_ENTRIES:
+        remove_agent(next(iter(agent_pool)))
+        pool_counters["evictions"] += 1
+
+    while len(agent_pool) > 1 and estimate_pool_bytes() > AGENT_POOL_MAX_BYTES:
+        remove_agent(next(iter(agent_pool)))
+        pool_counters["evictions"] += 1
+
 def cleanup_expired_agents():
     now = datetime.utcnow()
-    expired_keys = [key for key, (_, last_active) in agent_pool.items()
+    expired_keys = [key for key, (_, last_active) in list(agent_pool.items())
                     if now - last_active > INACTIVITY_TIMEOUT]
 
     for key in expired_keys:
-        del agent_pool[key]
+        remove_agent(key)
+    pool_counters["expirations"] += len(expired_keys)
+
+def get_pool_stats() -> dict:
+    with _runtime_lock:
+        runtimes = len(runtime_registry)
+    return {
+        **pool_counters,
+        "sessions": len(agent_pool),
+        "runtimes": runtimes,
+        "estimated_bytes": estimate_pool_bytes(),
+        "max_entries": AGENT_POOL_MAX_ENTRIES,
+        "max_bytes": AGENT_POOL_MAX_BYTES,
+    }
+
+async def run_pool_sweeper():
+    while True:
+        await asyncio.sleep(AGENT_POOL_SWEEP_SECONDS)
+        try:
+            cleanup_expired_agents()
+            enforce_pool_limits()
+        except Exception as e:
+            print("❌ ERROR in agent pool sweeper:", str(e))
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import List
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
+
+from app.core.config import UPLOAD_DIR, UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_REQUEST_BYTES, UPLOAD_CHUNK_BYTES
+
+
+@dataclass
+class SpooledUpload:
+    filename: str
+    path: str
+    content_hash: str
+    size: int
+
+
+class _PartSizeCounter:
+    """Counts the bytes of each multipart part as the body streams in, storing nothing."""
+
+    def __init__(self, boundary: bytes, max_part_bytes: int):
+        self.max_part_bytes = max_part_bytes
+        self.size = 0
+        self.filename = ""
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+        })
+
+    def _on_part_begin(self):
+        self.size = 0
+        self.filename = ""
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self.size += end - start
+        if self.size > self.max_part_bytes:
+            raise HTTPException(status_code=413, detail=f"{self.filename or 'A file'} exceeds the per-file upload limit")
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, params = parse_options_header(self._header_value)
+            self.filename = params.get(b"filename", b"").decode("utf-8", "replace")
+        self._header_field = b""
+        self._header_value = b""
+
+    def feed(self, chunk: bytes):
+        self._parser.write(chunk)
+
+
+class UploadLimitMiddleware:
+    """Rejects oversized multipart requests with 413 while the body is still arriving.
+
+    Starlette reads the whole body into temporary files before a handler
+    runs, so limits checked in the handler come too late. A declared
+    Content-Length over the request limit is refused before reading;
+    otherwise received bytes are counted against the request limit and
+    per part against the file limit, and the read stops at the first
+    chunk over either.
+    """
+
+    def __init__(self, app, max_request_bytes: int = UPLOAD_MAX_REQUEST_BYTES,
+                 max_file_bytes: int = UPLOAD_MAX_FILE_BYTES):
+        self.app = app
+        self.max_request_bytes = max_request_bytes
+        self.max_file_bytes = max_file_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        content_type, params = parse_options_header(headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_request_bytes:
+            response = JSONResponse(status_code=413, content={"detail": "Upload exceeds the per-request size limit"})
+            return await response(scope, receive, send)
+
+        parts = _PartSizeCounter(params[b"boundary"], self.max_file_bytes)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > self.max_request_bytes:
+                    raise HTTPException(status_code=413, detail="Upload exceeds the per-request size limit")
+                parts.feed(chunk)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_uploads(files: List[UploadFile]) -> List[SpooledUpload]:
+    """Copy uploads to ``UPLOAD_DIR`` chunk by chunk.
+
+    Only one chunk per file is held in memory. Size limits are enforced
+    while the request body arrives by UploadLimitMiddleware; the checks
+    here only back it up. On any failure the files written so far are
+    removed.
+    """
+    spooled: List[SpooledUpload] = []
+    request_bytes = 0
+    try:
+        for file in files:
+            path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+            digest = hashlib.sha256()
+            size = 0
+            async with aiofiles.open(path, "wb") as out:
+                spooled.append(SpooledUpload(file.filename, path, "", 0))
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    request_bytes += len(chunk)
+                    if size > UPLOAD_MAX_FILE_BYTES:
+                        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds the per-file upload limit")
+                    if request_bytes > UPLOAD_MAX_REQUEST_BYTES:
+                        raise HTTPException(status_code=413, detail="Upload exceeds the per-request size limit")
+                    digest.update(chunk)
+                    await out.write(chunk)
+            spooled[-1].content_hash = digest.hexdigest()
+            spooled[-1].size = size
+    except BaseException:
+        remove_uploads(spooled)
+        raise
+    return spooled
+
+
+def remove_uploads(uploads: List[SpooledUpload]):
+    for upload in uploads:
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
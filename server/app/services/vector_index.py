@@ -0,0 +1,490 @@
+import asyncio
+import math
+import os
+import pickle
+import shutil
+import time
+import uuid
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from app.core.config import (
+    VECTOR_COMPACT_MIN_SEGMENTS, VECTOR_COMPACT_INTERVAL_SECONDS, VECTOR_INDEX_TYPE,
+    VECTOR_HNSW_MIN_VECTORS, VECTOR_IVF_MIN_VECTORS, VECTOR_HNSW_M, VECTOR_HNSW_EF_SEARCH, VECTOR_IVF_NPROBE,
+    VECTOR_INDEX_MMAP, VECTOR_RETIRED_GRACE_SECONDS,
+)
+from app.core.database import db
+from app.services.embedding_pipeline import embed_in_batches
+from app.services.embedding_backends import get_agent_embeddings
+from app.services.agent_versions import bump_agent_version
+
+VECTOR_ROOT = "data/vectors"
+
+INDEX_TYPES = ("auto", "flat", "hnsw", "hnsw_sq8", "ivf", "ivf_sq8", "ivf_pq")
+
+# IVF and PQ need enough points per centroid to train; smaller sets stay flat
+_IVF_MIN_TRAIN_VECTORS = 1000
+_IVF_POINTS_PER_LIST = 39
+# Each PQ sub-quantizer learns 256 centroids
+_PQ_MIN_TRAIN_VECTORS = 256 * _IVF_POINTS_PER_LIST
+
+# Raw float32 vectors kept beside each index so rebuilds never re-quantize
+_VECTORS_FILE = "vectors.npy"
+
+
+def agent_index_dir(agent_id: str) -> str:
+    return f"{VECTOR_ROOT}/{agent_id}"
+
+
+class SegmentedVectorStore(VectorStore):
+    """View over an agent's base index plus its upload segments.
+
+    Searches fan out to every segment with the query embedded once, and the
+    per-segment hits are merged by distance. Segments are immutable, so
+    ``add_texts`` writes the texts as a new segment of the agent.
+    """
+
+    def __init__(self, agent_id: str, stores: List[FAISS], embedding: Embeddings):
+        self.agent_id = agent_id
+        self.stores = stores
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def ntotal(self) -> int:
+        return sum(store.index.ntotal for store in self.stores)
+
+    def estimate_bytes(self) -> int:
+        total = 0
+        for store in self.stores:
+            # Compressed and graph indexes differ a lot from ntotal * d * 4
+            total += getattr(store, "index_bytes", store.index.ntotal * store.index.d * 4)
+            total += sum(len(doc.page_content) for doc in store.docstore._dict.values())
+        return total
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        results = []
+        for store in self.stores:
+            results.extend(store.similarity_search_with_score_by_vector(embedding, k, **kwargs))
+        # FAISS returns distances, lower is closer
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self.stores[0]._select_relevance_score_fn()
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        store = _add_segment(self.agent_id, texts, self._embedding, metadatas=metadatas, publish=True)
+        self.stores.append(store)
+        return list(store.index_to_docstore_id.values())
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        agent_id: str,
+        **kwargs: Any,
+    ) -> "SegmentedVectorStore":
+        """Add ``texts`` as a new segment of an existing agent and return its full index."""
+        _add_segment(agent_id, list(texts), embedding, metadatas=metadatas, publish=True)
+        return load_agent_index(agent_id, embedding)
+
+
+def resolve_index_type(requested: Optional[str], count: int) -> str:
+    """Concrete index type for ``count`` vectors; "auto" picks by size thresholds."""
+    requested = requested or VECTOR_INDEX_TYPE
+    if requested == "auto":
+        if count < VECTOR_HNSW_MIN_VECTORS:
+            return "flat"
+        if count < VECTOR_IVF_MIN_VECTORS:
+            return "hnsw"
+        return "ivf_sq8"
+    if requested.startswith("ivf") and count < _IVF_MIN_TRAIN_VECTORS:
+        return "flat"
+    if requested == "ivf_pq" and count < _PQ_MIN_TRAIN_VECTORS:
+        return "ivf_sq8"
+    return requested
+
+
+def _pq_subquantizers(d: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def _index_factory_string(index_type: str, count: int, d: int) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{VECTOR_HNSW_M}"
+    if index_type == "hnsw_sq8":
+        return f"HNSW{VECTOR_HNSW_M},SQ8"
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // _IVF_POINTS_PER_LIST))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{_pq_subquantizers(d)}"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def _set_search_params(index: faiss.Index, index_type: str):
+    if index_type.startswith("hnsw"):
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", VECTOR_HNSW_EF_SEARCH)
+    elif index_type.startswith("ivf"):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", VECTOR_IVF_NPROBE)
+
+
+def _build_store(documents: List[Document], vectors: np.ndarray, embeddings: Embeddings, index_type: str) -> FAISS:
+    """Build a FAISS store of ``index_type``, training the quantizer on ``vectors`` if needed."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, d = vectors.shape
+    index = faiss.index_factory(d, _index_factory_string(index_type, count, d), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    _set_search_params(index, index_type)
+
+    ids = [str(uuid.uuid4()) for _ in documents]
+    store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+    store.raw_vectors = vectors
+    return store
+
+
+def _write_store(store: FAISS, agent_id: str, prefix: str) -> str:
+    # Write to a hidden temp dir first and rename, so readers never see a partial segment
+    agent_dir = agent_index_dir(agent_id)
+    os.makedirs(agent_dir, exist_ok=True)
+    name = f"{prefix}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    tmp_path = os.path.join(agent_dir, f".tmp-{name}")
+    final_path = os.path.join(agent_dir, name)
+    store.save_local(tmp_path)
+    np.save(os.path.join(tmp_path, _VECTORS_FILE), store.raw_vectors)
+    os.rename(tmp_path, final_path)
+    return final_path
+
+
+def _insert_segment(conn, agent_id: str, path: str, kind: str, chunks: int, index_type: str):
+    conn.execute(
+        "INSERT INTO vector_segments (agent_id, path, kind, chunks, index_type) VALUES (?, ?, ?, ?, ?)",
+        (agent_id, path, kind, chunks, index_type),
+    )
+
+
+def _add_segment(
+    agent_id: str,
+    texts: List[str],
+    embeddings: Embeddings,
+    on_progress: Optional[Callable[[int], None]] = None,
+    index_type: Optional[str] = None,
+    metadatas: Optional[List[dict]] = None,
+    publish: bool = False,
+    on_register: Optional[Callable[[Any], None]] = None,
+) -> FAISS:
+    vectors = embed_in_batches(embeddings, texts, on_progress)
+    resolved = resolve_index_type(index_type or get_agent_index_type(agent_id), len(texts))
+    metadatas = metadatas or [{} for _ in texts]
+    documents = [Document(page_content=text, metadata=dict(metadata)) for text, metadata in zip(texts, metadatas)]
+    store = _build_store(documents, np.array(vectors), embeddings, resolved)
+    path = _write_store(store, agent_id, "seg")
+
+    def register(conn):
+        _insert_segment(conn, agent_id, path, "segment", len(texts), resolved)
+        if publish:
+            # Outside an ingestion job nothing else tells other workers about the segment
+            conn.execute("UPDATE agents SET vector_index_path = ? WHERE id = ?", (agent_index_dir(agent_id), agent_id))
+            bump_agent_version(conn, agent_id)
+        if on_register:
+            on_register(conn)
+
+    try:
+        db.run_in_transaction(register)
+    except Exception:
+        # Never registered, so no reader can have it open
+        _remove_index_path(agent_id, path)
+        raise
+    return store
+
+
+def append_segment(
+    agent_id: str,
+    texts: List[str],
+    embeddings: Embeddings,
+    on_progress: Optional[Callable[[int], None]] = None,
+    index_type: Optional[str] = None,
+    on_register: Optional[Callable[[Any], None]] = None,
+) -> str:
+    """Embed ``texts`` into a new segment for the agent; cost scales with the upload only.
+
+    ``on_register(conn)`` runs in the transaction that registers the segment;
+    if it raises, the segment is discarded.
+    """
+    _add_segment(agent_id, texts, embeddings, on_progress, index_type, on_register=on_register)
+    return agent_index_dir(agent_id)
+
+
+def get_agent_index_type(agent_id: str) -> Optional[str]:
+    row = db.fetchone("SELECT index_type FROM agents WHERE id = ?", (agent_id,))
+    return row["index_type"] if row else None
+
+
+def list_segments(agent_id: str) -> List[Tuple[int, str, str, str]]:
+    rows = db.fetchall(
+        '''
+        SELECT id, path, kind, index_type FROM vector_segments
+        WHERE agent_id = ? AND retired_at IS NULL
+        ORDER BY kind = 'segment', id
+        ''',
+        (agent_id,),
+    )
+    return [(row["id"], row["path"], row["kind"], row["index_type"]) for row in rows]
+
+
+def _read_index(path: str, index_type: str) -> Tuple[faiss.Index, bool]:
+    index_file = os.path.join(path, "index.faiss")
+    if VECTOR_INDEX_MMAP:
+        # IVF maps its inverted lists; flat and HNSW map their code arrays. The two
+        # flags cannot be combined, and older FAISS builds lack IO_FLAG_MMAP_IFC.
+        if index_type.startswith("ivf"):
+            flag = faiss.IO_FLAG_MMAP
+        else:
+            flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if flag is not None:
+            try:
+                return faiss.read_index(index_file, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError:
+                pass
+    return faiss.read_index(index_file), False
+
+
+def _load_store(path: str, embeddings: Embeddings, index_type: str = "flat") -> FAISS:
+    index, mapped = _read_index(path, index_type)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        # Written by save_local from our own segments, same trust as FAISS.load_local
+        docstore, index_to_docstore_id = pickle.load(f)
+    store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    _set_search_params(store.index, index_type)
+    # Mapped pages live in the shared page cache, not this worker's heap
+    store.index_bytes = 0 if mapped else os.path.getsize(os.path.join(path, "index.faiss"))
+    return store
+
+
+def _store_contents(path: str, store: FAISS) -> Tuple[List[Document], np.ndarray]:
+    documents = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+    vectors_path = os.path.join(path, _VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        vectors = np.load(vectors_path, mmap_mode="r")
+    else:
+        # Flat indexes from before raw vectors were kept can be reconstructed exactly
+        vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    return documents, vectors
+
+
+def load_agent_index(agent_id: str, embeddings: Embeddings, attempts: int = 3) -> Optional[SegmentedVectorStore]:
+    for attempt in range(attempts):
+        segments = list_segments(agent_id)
+        if not segments:
+            return None
+        try:
+            stores = [_load_store(path, embeddings, index_type) for _, path, _, index_type in segments]
+            return SegmentedVectorStore(agent_id, stores, embeddings)
+        except Exception:
+            # A compaction may have retired a segment between listing and loading
+            if attempt == attempts - 1:
+                raise
+    return None
+
+
+def _remove_index_path(agent_id: str, path: str):
+    # Raises OSError while a file is still open or mapped somewhere (Windows)
+    if os.path.normpath(path) == os.path.normpath(agent_index_dir(agent_id)):
+        # Legacy single index saved directly in the agent directory
+        for filename in ("index.faiss", "index.pkl"):
+            file_path = os.path.join(path, filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    elif os.path.exists(path):
+        shutil.rmtree(path)
+
+
+def compact_agent_index(agent_id: str, embeddings: Embeddings, force: bool = False) -> bool:
+    """Rebuild the base and all current segments as one new base and swap it in.
+
+    The base is built with the agent's index type, so this is also the rebuild
+    path after the type changes. ``force`` rebuilds even a single segment.
+    """
+    segments = list_segments(agent_id)
+    if not segments or (len(segments) < 2 and not force):
+        return False
+
+    documents = []
+    vector_parts = []
+    for _, path, _, index_type in segments:
+        segment_documents, segment_vectors = _store_contents(path, _load_store(path, embeddings, index_type))
+        documents.extend(segment_documents)
+        vector_parts.append(segment_vectors)
+    vectors = np.concatenate(vector_parts)
+
+    resolved = resolve_index_type(get_agent_index_type(agent_id), len(documents))
+    merged = _build_store(documents, vectors, embeddings, resolved)
+    new_path = _write_store(merged, agent_id, "base")
+
+    segment_ids = [segment_id for segment_id, _, _, _ in segments]
+
+    def swap(conn):
+        placeholders = ",".join("?" for _ in segment_ids)
+        retired = conn.execute(
+            f"""
+            UPDATE vector_segments SET retired_at = CURRENT_TIMESTAMP
+            WHERE id IN ({placeholders}) AND retired_at IS NULL
+            """,
+            segment_ids,
+        ).rowcount
+        if retired != len(segment_ids):
+            # Another worker compacted or the agent was deleted meanwhile
+            raise RuntimeError("stale compaction")
+        _insert_segment(conn, agent_id, new_path, "base", merged.index.ntotal, resolved)
+        # Other processes still hold the retired segments and must reload
+        bump_agent_version(conn, agent_id)
+
+    try:
+        db.run_in_transaction(swap)
+    except RuntimeError:
+        shutil.rmtree(new_path, ignore_errors=True)
+        return False
+    # The retired segments' files are removed by remove_retired_segments after the grace period
+    return True
+
+
+def delete_agent_index(conn, agent_id: str):
+    """Retire all of the agent's segments; their files go once other workers have let go."""
+    conn.execute(
+        "UPDATE vector_segments SET retired_at = CURRENT_TIMESTAMP WHERE agent_id = ? AND retired_at IS NULL",
+        (agent_id,),
+    )
+
+
+def remove_retired_segments() -> int:
+    """Delete files of segments retired more than VECTOR_RETIRED_GRACE_SECONDS ago.
+
+    Other workers keep a retired segment loaded, possibly mapped, until their
+    next version check, so files are only removed after a grace period. A
+    segment whose files cannot be removed yet stays registered and is tried
+    again on the next pass. Directories of deleted agents go with their last
+    segment.
+    """
+    rows = db.fetchall(
+        "SELECT id, agent_id, path FROM vector_segments WHERE retired_at < datetime('now', ?)",
+        (f"-{VECTOR_RETIRED_GRACE_SECONDS} seconds",),
+    )
+    removed = 0
+    for row in rows:
+        try:
+            _remove_index_path(row["agent_id"], row["path"])
+        except OSError as e:
+            print(f"❌ ERROR removing retired segment {row['path']}, will retry:", str(e))
+            continue
+        db.execute("DELETE FROM vector_segments WHERE id = ?", (row["id"],))
+        removed += 1
+
+    for agent_id in {row["agent_id"] for row in rows}:
+        orphaned = not db.fetchone(
+            "SELECT 1 FROM agents WHERE id = ? UNION ALL SELECT 1 FROM vector_segments WHERE agent_id = ?",
+            (agent_id, agent_id),
+        )
+        if orphaned and os.path.exists(agent_index_dir(agent_id)):
+            try:
+                shutil.rmtree(agent_index_dir(agent_id))
+            except OSError as e:
+                print(f"❌ ERROR removing index directory of deleted agent {agent_id}:", str(e))
+    return removed
+
+
+def register_legacy_indexes(cursor):
+    """Register single-directory FAISS indexes from before segments existed as bases."""
+    cursor.execute('''
+        SELECT id, vector_index_path FROM agents
+        WHERE vector_index_path IS NOT NULL
+          AND id NOT IN (SELECT agent_id FROM vector_segments)
+    ''')
+    for agent_id, path in cursor.fetchall():
+        if os.path.exists(os.path.join(path, "index.faiss")):
+            cursor.execute(
+                "INSERT INTO vector_segments (agent_id, path, kind, chunks) VALUES (?, ?, 'base', 0)",
+                (agent_id, path),
+            )
+
+
+def agents_needing_compaction() -> List[str]:
+    """Agents with too many segments, or whose index has outgrown the type it was built as."""
+    rows = db.fetchall('''
+        SELECT s.agent_id, a.index_type AS requested, COUNT(*) AS segments,
+               SUM(s.chunks) AS chunks, MAX(s.index_type) AS built
+        FROM vector_segments s
+        JOIN agents a ON a.id = s.agent_id
+        WHERE s.retired_at IS NULL
+        GROUP BY s.agent_id
+    ''')
+    agent_ids = []
+    for row in rows:
+        if row["segments"] >= VECTOR_COMPACT_MIN_SEGMENTS:
+            agent_ids.append(row["agent_id"])
+        elif row["segments"] == 1 and row["chunks"] and resolve_index_type(row["requested"], row["chunks"]) != row["built"]:
+            agent_ids.append(row["agent_id"])
+    return agent_ids
+
+
+async def run_compactor():
+    while True:
+        await asyncio.sleep(VECTOR_COMPACT_INTERVAL_SECONDS)
+        try:
+            for agent_id in await asyncio.to_thread(agents_needing_compaction):
+                embeddings = await asyncio.to_thread(get_agent_embeddings, agent_id)
+                if await asyncio.to_thread(compact_agent_index, agent_id, embeddings):
+                    print(f"✅ Compacted vector index for agent {agent_id}")
+        except Exception as e:
+            print("❌ ERROR in vector index compactor:", str(e))
+        try:
+            await asyncio.to_thread(remove_retired_segments)
+        except Exception as e:
+            print("❌ ERROR removing retired vector segments:", str(e))
@@ -0,0 +1,47 @@
+"""Code run inside spawned worker processes.
+
+Worker pools use the spawn start method: forked children would inherit
+the database pool's locks and open SQLite handles. Every spawned worker
+imports its module from scratch, so modules in this package stay free of
+app.services imports and start in milliseconds.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from typing import Callable, Optional
+
+
+class SpawnPool:
+    """ProcessPoolExecutor of spawned workers, started on first use.
+
+    ``initargs`` builds the initializer's arguments from the spawn context,
+    so synchronisation primitives passed to workers come from the same
+    context. After ``shutdown`` the next ``get`` starts a fresh pool.
+    """
+
+    def __init__(self, max_workers: int, initializer: Optional[Callable] = None,
+                 initargs: Optional[Callable[[BaseContext], tuple]] = None):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=self.initializer,
+                    initargs=self.initargs(context) if self.initargs else (),
+                )
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,43 @@
+"""Docx letter rendering for mail-merge workers."""
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from app.fill_docx.offer import (
+    OFFER_TEMPLATE_PATH, CONFIRMATION_TEMPLATE_PATH,
+    generate_offer_letter_docx, generate_confirmation_letter_docx, template_placeholders,
+)
+
+LETTER_RENDERERS = {
+    "offer_letter": generate_offer_letter_docx,
+    "confirmation_letter": generate_confirmation_letter_docx,
+}
+
+LETTER_TEMPLATE_PATHS = {
+    "offer_letter": OFFER_TEMPLATE_PATH,
+    "confirmation_letter": CONFIRMATION_TEMPLATE_PATH,
+}
+
+# (docx bytes, None) on success, (None, error) otherwise
+RenderResult = Tuple[Optional[bytes], Optional[str]]
+
+
+@lru_cache(maxsize=None)
+def letter_placeholders(template_type: str) -> FrozenSet[str]:
+    return frozenset(template_placeholders(LETTER_TEMPLATE_PATHS[template_type]))
+
+
+def render_batch(template_type: str, field_sets: List[Dict[str, Any]]) -> List[RenderResult]:
+    render = LETTER_RENDERERS[template_type]
+    placeholders = letter_placeholders(template_type)
+    results = []
+    for fields in field_sets:
+        # An unfilled placeholder would otherwise be sent as literal [name] text
+        missing = sorted(placeholders - fields.keys())
+        if missing:
+            results.append((None, f"Missing field(s): {', '.join(missing)}"))
+            continue
+        try:
+            results.append((render({key: str(value) for key, value in fields.items()}), None))
+        except Exception as e:
+            results.append((None, f"Failed to render letter: {e}"))
+    return results
@@ -0,0 +1,83 @@
+"""Page hashing, text extraction and OCR for PDF extraction workers."""
+import hashlib
+from typing import Dict, List, Tuple
+
+import pdfplumber
+import pytesseract
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+# Page entries that decide what extract_text and OCR see
+_PAGE_KEYS = ("Contents", "Resources", "MediaBox", "CropBox", "Rotate")
+# Back-references that would pull in the rest of the document
+_SKIPPED_KEYS = {"Parent", "P"}
+
+# Limits concurrent tesseract runs inside extraction worker processes
+_ocr_semaphore = None
+
+
+def init_page_worker(ocr_semaphore):
+    global _ocr_semaphore
+    _ocr_semaphore = ocr_semaphore
+
+
+def _feed(digest, obj, seen: Dict[int, int]):
+    if isinstance(obj, PDFObjRef):
+        # Object numbers differ between files, so repeats are named by first-visit order
+        if obj.objid in seen:
+            digest.update(b"R%d" % seen[obj.objid])
+            return
+        seen[obj.objid] = len(seen)
+        obj = obj.resolve()
+    if isinstance(obj, PDFStream):
+        digest.update(b"S")
+        _feed(digest, obj.attrs, seen)
+        raw = obj.get_rawdata()
+        digest.update(raw if raw is not None else obj.get_data())
+    elif isinstance(obj, dict):
+        digest.update(b"D%d" % len(obj))
+        for key in sorted(obj, key=str):
+            if key in _SKIPPED_KEYS:
+                continue
+            digest.update(str(key).encode("utf-8"))
+            _feed(digest, obj[key], seen)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"L%d" % len(obj))
+        for item in obj:
+            _feed(digest, item, seen)
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+
+def page_hash(page) -> str:
+    """Hash of everything a pdfplumber page's text depends on.
+
+    Covers content streams, resources (fonts, images, forms) and geometry,
+    so the same page hashes the same in any file it appears in.
+    """
+    digest = hashlib.sha256()
+    seen: Dict[int, int] = {}
+    attrs = page.page_obj.attrs
+    for key in _PAGE_KEYS:
+        if key in attrs:
+            digest.update(key.encode("utf-8"))
+            _feed(digest, attrs[key], seen)
+    return digest.hexdigest()
+
+
+def extract_page_text(page) -> Tuple[str, bool]:
+    page_text = page.extract_text()
+    # If no text found, try OCR on that specific page
+    if not page_text or len(page_text.strip()) < 30:
+        print("[OCR Fallback for this page]")
+        page_image = page.to_image(resolution=300)
+        image = page_image.original
+        if _ocr_semaphore is not None:
+            with _ocr_semaphore:
+                return pytesseract.image_to_string(image), True
+        return pytesseract.image_to_string(image), True
+    return page_text, False
+
+
+def extract_pages(pdf_path: str, numbers: List[int]) -> List[Tuple[str, bool]]:
+    with pdfplumber.open(pdf_path) as pdf:
+        return [extract_page_text(pdf.pages[i]) for i in numbers]
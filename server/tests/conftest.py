@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Tests import the app the way uvicorn does, from the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+# Never touch the development database
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="agents-test-"), "agents.db")
@@ -0,0 +1,100 @@
+import json
+import threading
+from collections import Counter
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_openai import OpenAIEmbeddings
+
+from app.services.embedding_pipeline import RateLimitedEmbeddings, TokenBucket, embed_in_batches
+
+
+class StubEmbeddingServer(ThreadingHTTPServer):
+    """OpenAI-compatible /embeddings endpoint that throttles chosen batches once."""
+
+    def __init__(self, throttled_first_texts):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.throttled = set(throttled_first_texts)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"]
+        with self.server.lock:
+            self.server.requests[texts[0]] += 1
+            throttle = texts[0] in self.server.throttled
+            self.server.throttled.discard(texts[0])
+        if throttle:
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "0.01"})
+            return
+        data = [{"object": "embedding", "index": i, "embedding": [float(text.split()[-1]), 1.0]} for i, text in enumerate(texts)]
+        self._reply(200, {"object": "list", "data": data, "model": body["model"],
+                          "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(throttled_first_texts):
+        server = StubEmbeddingServer(throttled_first_texts)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _embeddings(server: StubEmbeddingServer, max_retries: int = 3) -> RateLimitedEmbeddings:
+    backend = OpenAIEmbeddings(api_key="test", base_url=server.base_url, check_embedding_ctx_length=False, max_retries=0)
+    return RateLimitedEmbeddings(backend, TokenBucket(0), TokenBucket(0), max_retries, backoff_seconds=0.01)
+
+
+def test_only_the_throttled_batch_is_retried(stub_server):
+    texts = [f"chunk {i}" for i in range(20)]
+    # Batches of 4 start with chunks 0, 4, 8, 12 and 16; the third one gets a 429 first
+    server = stub_server({"chunk 8"})
+    embeddings = _embeddings(server)
+    progress = []
+
+    vectors = embed_in_batches(embeddings, texts, progress.append, batch_size=4, max_in_flight=3)
+
+    assert [vector[0] for vector in vectors] == [float(i) for i in range(20)]
+    assert server.requests == {"chunk 0": 1, "chunk 4": 1, "chunk 8": 2, "chunk 12": 1, "chunk 16": 1}
+    assert embeddings.stats()["retries"] == 1
+    assert sorted(progress) == [4, 8, 12, 16, 20]
+
+
+def test_throttling_past_max_retries_fails_the_call(stub_server):
+    server = stub_server({"chunk 0"})
+    embeddings = _embeddings(server, max_retries=0)
+
+    with pytest.raises(Exception) as error:
+        embed_in_batches(embeddings, ["chunk 0", "chunk 1"], batch_size=1)
+
+    assert getattr(error.value, "status_code", None) == 429
+    assert server.requests["chunk 0"] == 1
@@ -0,0 +1,187 @@
+import asyncio
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi import HTTPException
+
+from app.core.config import init_db
+from app.core.database import db
+from app.services import mail_queue
+
+
+class RecordingHandler:
+    """Accepts mail, except that it answers 451 to the first ``defer`` messages,
+    450 to the first ``greylist`` recipients and 550 to recipients in ``rejected``."""
+
+    def __init__(self, defer: int = 0, greylist: int = 0, rejected=()):
+        self.defer = defer
+        self.greylist = greylist
+        self.rejected = set(rejected)
+        self.attempts = 0
+        self.delivered = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.rejected:
+            return "550 5.1.1 No such user"
+        if self.greylist > 0:
+            self.greylist -= 1
+            return "450 4.2.0 Greylisted, try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.attempts <= self.defer:
+            return "451 4.3.0 Try again later"
+        self.delivered.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+def _free_port() -> int:
+    # The controller connects to its own port on start, so it cannot be 0
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    init_db()
+    db.execute("DELETE FROM outbound_emails")
+    controllers = []
+
+    def start(handler: RecordingHandler) -> RecordingHandler:
+        controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+        controller.start()
+        controllers.append(controller)
+        monkeypatch.setattr(mail_queue, "SMTP_HOST", "127.0.0.1")
+        monkeypatch.setattr(mail_queue, "SMTP_PORT", controller.port)
+        monkeypatch.setattr(mail_queue, "SMTP_USE_TLS", False)
+        monkeypatch.setattr(mail_queue, "APP_EMAIL", "hr@example.com")
+        monkeypatch.setattr(mail_queue, "APP_PASSWORD", None)
+        monkeypatch.setattr(mail_queue, "MAIL_BACKOFF_SECONDS", 0)
+        monkeypatch.setattr(mail_queue, "MAIL_POLL_SECONDS", 0.05)
+        return handler
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def _send_until_done(message_id: str, timeout: float = 10.0) -> dict:
+    async def run():
+        # The module-level event belongs to whichever loop first waited on it
+        mail_queue._mail_available = asyncio.Event()
+        sender = asyncio.create_task(mail_queue._sender_loop(1))
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                email = await db.run(mail_queue.get_email, message_id)
+                if email["status"] in ("sent", "failed"):
+                    return email
+                await asyncio.sleep(0.05)
+            raise AssertionError(f"email still {email['status']} after {timeout}s")
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def _stored_message(message_id: str) -> bytes:
+    return db.fetchone("SELECT message FROM outbound_emails WHERE id = ?", (message_id,))["message"]
+
+
+def test_queued_email_is_delivered_with_attachment(smtp_server):
+    handler = smtp_server(RecordingHandler())
+    message_id = mail_queue.enqueue_email(None, "jane@example.com", "Offer", "Welcome", [("offer.docx", b"docx")])
+
+    email = _send_until_done(message_id)
+
+    assert email["status"] == "sent"
+    assert email["attempts"] == 1
+    assert [envelope.rcpt_tos for envelope in handler.delivered] == [["jane@example.com"]]
+    assert b'filename="offer.docx"' in handler.delivered[0].content
+    assert _stored_message(message_id) == b""
+
+
+def test_deferred_email_is_retried_until_sent(smtp_server):
+    handler = smtp_server(RecordingHandler(defer=2))
+    message_id = mail_queue.enqueue_email(None, "jane@example.com", "Offer", "Welcome", [])
+
+    email = _send_until_done(message_id)
+
+    assert email["status"] == "sent"
+    assert email["attempts"] == 3
+    assert handler.attempts == 3
+    assert len(handler.delivered) == 1
+
+
+def test_greylisted_recipient_is_retried(smtp_server):
+    handler = smtp_server(RecordingHandler(greylist=1))
+    message_id = mail_queue.enqueue_email(None, "jane@example.com", "Offer", "Welcome", [])
+
+    email = _send_until_done(message_id)
+
+    assert email["status"] == "sent"
+    assert email["attempts"] == 2
+    assert len(handler.delivered) == 1
+
+
+def test_rejected_recipient_fails_without_retry(smtp_server):
+    handler = smtp_server(RecordingHandler(rejected={"nobody@example.com"}))
+    message_id = mail_queue.enqueue_email(None, "nobody@example.com", "Offer", "Welcome", [])
+
+    email = _send_until_done(message_id)
+
+    assert email["status"] == "failed"
+    assert email["attempts"] == 1
+    assert "No such user" in email["error"]
+    assert handler.delivered == []
+
+
+def test_oversized_email_is_left_out_of_its_batch(smtp_server, monkeypatch):
+    smtp_server(RecordingHandler())
+    monkeypatch.setattr(mail_queue, "MAIL_MAX_MESSAGE_BYTES", 1024)
+
+    (jane_id, jane_error), (john_id, john_error) = mail_queue.enqueue_emails(None, [
+        ("jane@example.com", "Offer", "Welcome", []),
+        ("john@example.com", "Offer", "Welcome", [("offer.docx", b"x" * 2048)]),
+    ])
+
+    assert jane_error is None
+    assert mail_queue.get_email(jane_id)["status"] == "queued"
+    assert john_id is None
+    assert "john@example.com" in john_error
+    assert db.fetchone("SELECT COUNT(*) FROM outbound_emails")[0] == 1
+
+
+def test_single_oversized_email_is_refused(smtp_server, monkeypatch):
+    smtp_server(RecordingHandler())
+    monkeypatch.setattr(mail_queue, "MAIL_MAX_MESSAGE_BYTES", 1024)
+
+    with pytest.raises(HTTPException) as error:
+        mail_queue.enqueue_email(None, "john@example.com", "Offer", "Welcome", [("offer.docx", b"x" * 2048)])
+
+    assert error.value.status_code == 413
+    assert db.fetchone("SELECT COUNT(*) FROM outbound_emails")[0] == 0
+
+
+def test_purge_keeps_queued_and_recent_emails(smtp_server):
+    smtp_server(RecordingHandler())
+    old_sent, old_queued, recent_failed = (
+        mail_queue.enqueue_email(None, "jane@example.com", "Offer", "Welcome", []) for _ in range(3)
+    )
+    db.execute("UPDATE outbound_emails SET status = 'sent' WHERE id = ?", (old_sent,))
+    db.execute("UPDATE outbound_emails SET status = 'failed' WHERE id = ?", (recent_failed,))
+    db.execute(
+        "UPDATE outbound_emails SET updated_at = datetime('now', '-365 days') WHERE id IN (?, ?)",
+        (old_sent, old_queued),
+    )
+
+    assert mail_queue.purge_finished_emails() == 1
+    assert mail_queue.get_email(old_sent) is None
+    assert mail_queue.get_email(old_queued)["status"] == "queued"
+    assert mail_queue.get_email(recent_failed)["status"] == "failed"